@@ -0,0 +1,181 @@
+# batch_othello.py
+# Siddhartha Desai
+
+import numpy
+import othello
+
+# Cell values. A lane's turn uses the same values for the player to move.
+BLACK = 1
+WHITE = -1
+EMPTY = 0
+
+# (column, row) steps of the 8 directions
+DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1),
+              (1, 1), (-1, -1), (1, -1), (-1, 1))
+
+
+#
+# Array functions
+#
+def _shift(cells: numpy.ndarray, d_col: int, d_row: int) -> numpy.ndarray:
+    '''Move every cell of every lane by the column and row steps, filling the
+    uncovered cells with False'''
+    shifted = numpy.zeros_like(cells)
+    cols = cells.shape[1]; rows = cells.shape[2]
+    source_cols = slice(max(0, -d_col), cols - max(0, d_col))
+    source_rows = slice(max(0, -d_row), rows - max(0, d_row))
+    target_cols = slice(max(0, d_col), cols - max(0, -d_col))
+    target_rows = slice(max(0, d_row), rows - max(0, -d_row))
+    shifted[:, target_cols, target_rows] = cells[:, source_cols, source_rows]
+    return shifted
+
+
+#
+# Batch class
+#
+class BatchOthello:
+    '''N games of the same size advanced together. The boards are one int8
+    array shaped (N, cols, rows), indexed like othello.get_board(), holding
+    BLACK, WHITE or EMPTY'''
+    def __init__(self, count: int, rows: int, cols: int, turn: str, top_left: str):
+        # Reuse the othello checks and starting layout
+        start = othello.othello(rows, cols, turn, top_left)
+        board = numpy.zeros((cols, rows), dtype = numpy.int8)
+        for col, column in enumerate(start.get_board()):
+            for row, cell in enumerate(column):
+                if cell == 'B':
+                    board[col, row] = BLACK
+                elif cell == 'W':
+                    board[col, row] = WHITE
+
+        self._num_rows = rows
+        self._num_cols = cols
+        self._board = numpy.repeat(board[numpy.newaxis], count, axis = 0)
+        self._turn = numpy.full(count, BLACK if turn == 'B' else WHITE, dtype = numpy.int8)
+        self._passed = numpy.zeros(count, dtype = bool)
+        self._done = numpy.zeros(count, dtype = bool)
+        self._legal = None
+
+        # The longest run of opposing disks that can be flipped
+        self._max_run = max(rows, cols) - 2
+
+    ### Move functions
+    def _run(self, start: numpy.ndarray, opp: numpy.ndarray, d_col: int, d_row: int) -> numpy.ndarray:
+        '''Return the opposing cells reached from the start cells by stepping
+        over opposing cells only. Stops as soon as no lane grows any further'''
+        frontier = _shift(start, d_col, d_row) & opp
+        run = frontier
+        for step in range(self._max_run - 1):
+            frontier = _shift(frontier, d_col, d_row) & opp
+            if not frontier.any():
+                break
+            run = run | frontier
+        return run
+
+    def _player_cells(self) -> tuple:
+        '''Return the own, opposing and empty cell masks of every lane'''
+        turn = self._turn[:, numpy.newaxis, numpy.newaxis]
+        own = self._board == turn
+        opp = self._board == -turn
+        empty = self._board == EMPTY
+        return own, opp, empty
+
+    def legal_moves(self) -> numpy.ndarray:
+        '''Return a bool array shaped like the boards that marks the legal
+        moves of the player to move in every lane that is still playing. The
+        result is kept until the next play'''
+        if self._legal is not None:
+            return self._legal
+        own, opp, empty = self._player_cells()
+        moves = numpy.zeros_like(own)
+        for d_col, d_row in DIRECTIONS:
+            run = self._run(own, opp, d_col, d_row)
+            moves |= _shift(run, d_col, d_row) & empty
+        moves[self._done] = False
+        self._legal = moves
+        return moves
+
+    def play(self, squares: numpy.ndarray) -> None:
+        '''Play one move in every lane. Squares holds the flat col * rows + row
+        index of each lane's move, which must be legal. Lanes without a legal
+        move pass whatever their square is, and a lane is over after two
+        passes in a row'''
+        legal = self.legal_moves()
+        can_move = legal.reshape(len(legal), -1).any(axis = 1)
+
+        # Passing lanes
+        passing = ~can_move & ~self._done
+        self._done |= passing & self._passed
+        self._passed = passing
+
+        # One-hot mask of the move of each moving lane
+        placed = numpy.zeros(legal.shape, dtype = bool)
+        lanes = numpy.flatnonzero(can_move)
+        placed.reshape(len(placed), -1)[lanes, squares[lanes]] = True
+        placed &= legal
+
+        own, opp, empty = self._player_cells()
+        flips = numpy.zeros_like(own)
+        for d_col, d_row in DIRECTIONS:
+            run = self._run(placed, opp, d_col, d_row)
+            closed = (_shift(run, d_col, d_row) & own).any(axis = (1, 2))
+            flips |= run & closed[:, numpy.newaxis, numpy.newaxis]
+
+        turn = numpy.broadcast_to(self._turn[:, numpy.newaxis, numpy.newaxis], self._board.shape)
+        changed = placed | flips
+        self._board[changed] = turn[changed]
+
+        # Hand the turn over in every lane that is still playing
+        self._turn[~self._done] *= -1
+        self._legal = None
+
+    def random_squares(self, generator: numpy.random.Generator) -> numpy.ndarray:
+        '''Return a uniformly random legal flat square for every lane, or 0
+        for lanes that have to pass'''
+        legal = self.legal_moves().reshape(len(self._board), -1)
+        noise = generator.random(legal.shape)
+        noise[~legal] = -1.0
+        return noise.argmax(axis = 1)
+
+    def play_random(self, generator: numpy.random.Generator = None) -> None:
+        '''Play random moves in every lane until all the games are over'''
+        if generator is None:
+            generator = numpy.random.default_rng()
+        while not self._done.all():
+            self.play(self.random_squares(generator))
+
+    def play_policy(self, policy) -> None:
+        '''Play until all the games are over, asking the policy for the flat
+        squares of every lane. It is called with the boards, the turns and the
+        legal move masks'''
+        while not self._done.all():
+            self.play(policy(self._board, self._turn, self.legal_moves()))
+
+    ### Getter methods
+    def get_boards(self) -> numpy.ndarray:
+        '''Return the (N, cols, rows) boards'''
+        return self._board
+
+    def get_turns(self) -> numpy.ndarray:
+        '''Return the player to move in every lane'''
+        return self._turn
+
+    def get_done(self) -> numpy.ndarray:
+        '''Return which lanes are over'''
+        return self._done
+
+    def get_white_scores(self) -> numpy.ndarray:
+        '''Return the white disk count of every lane'''
+        return (self._board == WHITE).sum(axis = (1, 2))
+
+    def get_black_scores(self) -> numpy.ndarray:
+        '''Return the black disk count of every lane'''
+        return (self._board == BLACK).sum(axis = (1, 2))
+
+    def winners(self, mode: str) -> numpy.ndarray:
+        '''Return BLACK, WHITE or EMPTY (a draw) for every lane, judged like
+        othello.winning_player'''
+        difference = numpy.sign(self.get_black_scores() - self.get_white_scores())
+        if mode == 'low':
+            difference = -difference
+        return difference.astype(numpy.int8)
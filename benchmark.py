@@ -0,0 +1,229 @@
+# benchmark.py
+# Siddhartha Desai
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import othello
+import instrumentation
+
+# Perft leaf counts from the starting position with black to move. A pass is
+# a ply, and a finished game counts as a leaf when it ends before the depth.
+# Both top left colors give the same counts, and the 8x8 counts match the
+# standard Othello ones.
+KNOWN_COUNTS = {
+    (4, 4): [4, 12, 44, 128, 424, 1256, 3624],
+    (6, 6): [4, 12, 56, 244, 1364, 7604, 47740],
+    (8, 8): [4, 12, 56, 244, 1396, 8200, 55092],
+    (10, 10): [4, 12, 56, 244, 1396, 8200, 55180],
+    (12, 12): [4, 12, 56, 244, 1396, 8200, 55180],
+    (14, 14): [4, 12, 56, 244, 1396, 8200, 55180],
+    (16, 16): [4, 12, 56, 244, 1396, 8200, 55180],
+}
+
+SQUARE_SIZES = [(size, size) for size in range(4, 17, 2)]
+ALL_SIZES = [(rows, cols) for rows in range(4, 17, 2) for cols in range(4, 17, 2)]
+
+
+#
+# Perft functions
+#
+def perft(game: othello.othello, depth: int) -> int:
+    '''Count the leaves of the game tree to the depth'''
+    if depth == 0:
+        return 1
+    moves = othello.legal_moves(game)
+    if not moves:
+        game.push_move(0, 0)
+        if othello.legal_moves(game):
+            nodes = perft(game, depth - 1)
+        else:
+            nodes = 1
+        game.pop_move()
+        return nodes
+
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move, flips in list(moves.items()):
+        game.push_move(game.get_square_bit(move[0], move[1]), flips)
+        nodes += perft(game, depth - 1)
+        game.pop_move()
+    return nodes
+
+def run_perft(sizes: list, depth: int) -> list:
+    '''Run perft for every size and both top left colors, and return one
+    result per run with the expected count where it is known'''
+    results = []
+    for rows, cols in sizes:
+        for top_left in ('W', 'B'):
+            game = othello.othello(rows, cols, 'B', top_left)
+            start = time.perf_counter()
+            nodes = perft(game, depth)
+            elapsed = time.perf_counter() - start
+
+            known = KNOWN_COUNTS.get((rows, cols))
+            expected = known[depth - 1] if known and depth <= len(known) else None
+            results.append({'rows': rows, 'cols': cols, 'top_left': top_left,
+                            'depth': depth, 'nodes': nodes, 'expected': expected,
+                            'ok': expected is None or nodes == expected,
+                            'seconds': elapsed,
+                            'nps': nodes / elapsed if elapsed else 0.0})
+    return results
+
+
+#
+# Micro-benchmark functions
+#
+def _midgame(rows: int, cols: int, plies: int, seed: int) -> tuple:
+    '''Return a game after some random plies and the moves that led there'''
+    generator = random.Random(seed)
+    game = othello.othello(rows, cols, 'B', 'W')
+    moves = []
+    for ply in range(plies):
+        legal = othello.legal_moves(game)
+        if not legal:
+            break
+        move = generator.choice(sorted(legal))
+        othello.apply_move(game, move)
+        moves.append(move)
+    return game, moves
+
+# Each timing is the best of this many runs, which keeps the gate steady
+REPEATS = 5
+
+def _time_calls(function, calls: int) -> dict:
+    '''Call the function and return the call count and the best time per
+    call over REPEATS runs'''
+    elapsed = None
+    for repeat in range(REPEATS):
+        start = time.perf_counter()
+        for call in range(calls):
+            function()
+        run = time.perf_counter() - start
+        if elapsed is None or run < elapsed:
+            elapsed = run
+    return {'calls': calls, 'seconds': elapsed, 'ns_per_call': elapsed / calls * 1e9}
+
+def run_micro(rows: int, cols: int, calls: int) -> dict:
+    '''Time the hot paths of othello.py on a midgame position'''
+    plies = rows * cols // 3
+    game, moves = _midgame(rows, cols, plies, 1)
+
+    def generate() -> None:
+        game.set_cached_moves(None)
+        othello.legal_moves(game)
+
+    def replay() -> None:
+        replayed = othello.othello(rows, cols, 'B', 'W')
+        for move in moves:
+            othello.make_a_move(replayed, list(move))
+            replayed.change_player()
+
+    results = {
+        'legal_moves': _time_calls(generate, calls),
+        'legal_moves_cached': _time_calls(lambda: othello.legal_moves(game), calls),
+        'update_score': _time_calls(game.update_score, calls),
+        'is_board_full': _time_calls(lambda: othello.is_board_full(game), calls),
+        'winning_player': _time_calls(
+            lambda: othello.winning_player(game, othello.is_board_full(game), 'high'), calls),
+    }
+
+    # make_a_move is timed over whole replayed games
+    replays = max(1, calls // max(1, len(moves)))
+    timing = _time_calls(replay, replays)
+    timing['calls'] = replays * len(moves)
+    timing['ns_per_call'] = timing['seconds'] / max(1, timing['calls']) * 1e9
+    results['make_a_move'] = timing
+    return results
+
+
+#
+# Regression gate functions
+#
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    '''Return the failures of the results against a baseline run: wrong
+    perft counts, perft nodes per second or micro-benchmark times more than
+    tolerance (a fraction) worse than the baseline'''
+    failures = []
+    for result in results['perft']:
+        if not result['ok']:
+            failures.append('perft {rows}x{cols} {top_left} depth {depth}: {nodes} nodes, '
+                            'expected {expected}'.format(**result))
+
+    old_perft = {(old['rows'], old['cols'], old['top_left'], old['depth']): old
+                 for old in baseline.get('perft', [])}
+    for result in results['perft']:
+        old = old_perft.get((result['rows'], result['cols'], result['top_left'], result['depth']))
+        if old is None:
+            continue
+        if old['nodes'] != result['nodes']:
+            failures.append('perft {rows}x{cols} {top_left} depth {depth}: node count '
+                            'changed'.format(**result))
+        if result['nps'] < old['nps'] * (1 - tolerance):
+            failures.append('perft {rows}x{cols} {top_left} depth {depth}: {nps:.0f} nps, '
+                            'baseline {old:.0f}'.format(old = old['nps'], **result))
+
+    for size, micro in results['micro'].items():
+        for name, timing in micro.items():
+            old = baseline.get('micro', {}).get(size, {}).get(name)
+            if old is not None and timing['ns_per_call'] > old['ns_per_call'] * (1 + tolerance):
+                failures.append('{} {}: {:.0f} ns per call, baseline {:.0f}'.format(
+                    size, name, timing['ns_per_call'], old['ns_per_call']))
+    return failures
+
+
+def main(arguments: list = None) -> None:
+    '''Run the benchmarks from the command line and print JSON'''
+    parser = argparse.ArgumentParser(description = 'Benchmark the Othello move generator.')
+    parser.add_argument('--depth', type = int, default = 5)
+    parser.add_argument('--all-sizes', action = 'store_true',
+                        help = 'every even rows x cols size instead of square boards only')
+    parser.add_argument('--calls', type = int, default = 2000)
+    parser.add_argument('--compare', help = 'baseline JSON file to gate against')
+    parser.add_argument('--tolerance', type = float, default = 0.2)
+    parser.add_argument('--instrument', action = 'store_true',
+                        help = 'add the game core counts of one more perft run to the output')
+    parser.add_argument('--output', help = 'file to write the JSON to instead of stdout')
+    args = parser.parse_args(arguments)
+
+    sizes = ALL_SIZES if args.all_sizes else SQUARE_SIZES
+    results = {'python': platform.python_version(),
+               'perft': run_perft(sizes, args.depth),
+               'micro': {'{}x{}'.format(rows, cols): run_micro(rows, cols, args.calls)
+                         for rows, cols in SQUARE_SIZES}}
+
+    # Counted on a separate run so the timings above stay clean
+    if args.instrument:
+        instrumentation.reset()
+        instrumentation.enable()
+        try:
+            run_perft(sizes, args.depth)
+        finally:
+            instrumentation.disable()
+        results['instrumentation'] = instrumentation.snapshot()
+
+    baseline = {}
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    failures = compare(results, baseline, args.tolerance)
+    results['failures'] = failures
+
+    text = json.dumps(results, indent = 2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+    if failures:
+        for failure in failures:
+            print(failure, file = sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+# dataset.py
+# Siddhartha Desai
+
+import os
+import sys
+import argparse
+import concurrent.futures
+import numpy
+import othello
+import game_record
+
+# Positions per shard file
+DEFAULT_SHARD_SIZE = 65536
+
+
+#
+# Position functions
+#
+def game_positions(record: tuple) -> tuple:
+    '''Replay a game and return (positions, final black count, final white
+    count). Positions is a list with a (black, white, turn, empties,
+    mobility, opponent mobility, frontier, opponent frontier) tuple for every
+    position where the player to move had a move'''
+    rows, cols, top_left, turn, mode, moves = record
+    game = othello.othello(rows, cols, turn, top_left, mode)
+    full = game.get_full_mask()
+    directions = game.get_directions()
+
+    positions = []
+    for move in moves:
+        if move is None:
+            othello.apply_move(game, None)
+            continue
+        own, opp = game.get_player_masks()
+        empty = full & ~(own | opp)
+        next_to_empty = 0
+        for direction in directions:
+            next_to_empty |= othello._shift(empty, direction)
+        positions.append((game.get_black_mask(), game.get_white_mask(),
+                          1 if game.current_turn() == 'B' else -1,
+                          game.get_empty_count(),
+                          len(othello.legal_moves(game)),
+                          othello._fill_moves(opp, own, full, directions).bit_count(),
+                          (own & next_to_empty).bit_count(),
+                          (opp & next_to_empty).bit_count()))
+        othello.apply_move(game, move)
+    return positions, game.get_black_score(), game.get_white_score()
+
+
+#
+# Shard writing class
+#
+def position_dtype(rows: int, cols: int) -> numpy.dtype:
+    '''Return the structured dtype of one position on a board size'''
+    return numpy.dtype([('black', numpy.bool_, (rows, cols)),
+                        ('white', numpy.bool_, (rows, cols)),
+                        ('turn', numpy.int8),
+                        ('empties', numpy.int16),
+                        ('mobility', numpy.int16),
+                        ('opponent_mobility', numpy.int16),
+                        ('frontier', numpy.int16),
+                        ('opponent_frontier', numpy.int16),
+                        ('result', numpy.int16),
+                        ('outcome', numpy.int8)])
+
+class ShardWriter:
+    '''Buffers positions per board size and writes each full buffer as one
+    .npy file of structured records, which np.load can memory-map. Result is
+    the final disk difference for the player to move, and outcome is 1, 0 or
+    -1 for a win, draw or loss under the game's mode'''
+    def __init__(self, directory: str, prefix: str = 'positions',
+                 shard_size: int = DEFAULT_SHARD_SIZE):
+        self._directory = directory
+        self._prefix = prefix
+        self._shard_size = shard_size
+        self._buffers = {}
+        self._shards = {}
+        self._positions = 0
+        self._paths = []
+        os.makedirs(directory, exist_ok = True)
+
+    def add_game(self, record: tuple) -> None:
+        '''Add every position of a game'''
+        rows, cols, top_left, turn, mode, moves = record
+        positions, black, white = game_positions(record)
+        sign = -1 if mode == 'low' else 1
+        buffer = self._buffers.setdefault((rows, cols), [])
+        for position in positions:
+            result = position[2] * (black - white)
+            outcome = sign * ((result > 0) - (result < 0))
+            buffer.append(position + (result, outcome))
+        if len(buffer) >= self._shard_size:
+            self._flush(rows, cols)
+
+    def _flush(self, rows: int, cols: int) -> None:
+        '''Write the buffered positions of a board size as one shard'''
+        buffer = self._buffers.get((rows, cols))
+        if not buffer:
+            return
+        count = len(buffer)
+        stride = cols + 1
+        shard = numpy.zeros(count, dtype = position_dtype(rows, cols))
+
+        # Unpack all the disk masks at once
+        size = (rows * stride + 7) // 8
+        for field, column in (('black', 0), ('white', 1)):
+            data = b''.join(position[column].to_bytes(size, 'little') for position in buffer)
+            bits = numpy.unpackbits(numpy.frombuffer(data, dtype = numpy.uint8),
+                                    bitorder = 'little')
+            bits = bits.reshape(count, size * 8)[:, :rows * stride]
+            shard[field] = bits.reshape(count, rows, stride)[:, :, :cols]
+
+        columns = numpy.array([position[2:] for position in buffer], dtype = numpy.int64)
+        for index, field in enumerate(('turn', 'empties', 'mobility', 'opponent_mobility',
+                                       'frontier', 'opponent_frontier', 'result', 'outcome')):
+            shard[field] = columns[:, index]
+
+        number = self._shards.get((rows, cols), 0)
+        self._shards[(rows, cols)] = number + 1
+        path = os.path.join(self._directory, '{}-{}x{}-{:05d}.npy'.format(
+            self._prefix, rows, cols, number))
+        numpy.save(path, shard)
+        self._paths.append(path)
+        self._positions += count
+        self._buffers[(rows, cols)] = []
+
+    def close(self) -> list:
+        '''Write the partly filled shards and return the paths of all shards'''
+        for rows, cols in list(self._buffers):
+            self._flush(rows, cols)
+        return self._paths
+
+    def get_positions(self) -> int:
+        '''Return how many positions have been written'''
+        return self._positions
+
+
+#
+# Pipeline functions
+#
+def extract(paths: list, directory: str, prefix: str = 'positions',
+            shard_size: int = DEFAULT_SHARD_SIZE, part: int = 0, parts: int = 1) -> list:
+    '''Stream the games of the record files into shards. With several parts,
+    only every parts-th game starting from the part-th is taken, so that
+    separate processes can share the same files. Returns the shard paths'''
+    writer = ShardWriter(directory, prefix, shard_size)
+    index = 0
+    for path in paths:
+        for record in game_record.read_records(path):
+            if index % parts == part:
+                writer.add_game(record)
+            index += 1
+    return writer.close()
+
+def extract_parallel(paths: list, directory: str, workers: int = None,
+                     shard_size: int = DEFAULT_SHARD_SIZE) -> list:
+    '''Split the games over a process pool, each worker writing its own
+    shards, and return the paths of all shards'''
+    if workers is None:
+        workers = os.cpu_count()
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as pool:
+        futures = [pool.submit(extract, paths, directory, 'part{:03d}'.format(part),
+                               shard_size, part, workers)
+                   for part in range(workers)]
+        shards = []
+        for future in futures:
+            shards.extend(future.result())
+    return shards
+
+
+def main(arguments: list = None) -> None:
+    '''Extract training positions from the command line'''
+    parser = argparse.ArgumentParser(description = 'Extract Othello training positions.')
+    parser.add_argument('directory')
+    parser.add_argument('records', nargs = '+', help = 'JSON-lines or .ogr game record files')
+    parser.add_argument('--shard-size', type = int, default = DEFAULT_SHARD_SIZE)
+    parser.add_argument('--workers', type = int, default = 1)
+    args = parser.parse_args(arguments)
+
+    if args.workers > 1:
+        shards = extract_parallel(args.records, args.directory, args.workers, args.shard_size)
+    else:
+        shards = extract(args.records, args.directory, shard_size = args.shard_size)
+    print('Wrote {} shards to {}'.format(len(shards), args.directory), file = sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
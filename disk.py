@@ -1,6 +1,8 @@
 # Each piece played is a Disk object
 
 class Disk:
+    __slots__ = ('_center', '_radius', '_color')
+
     def __init__(self, center: tuple, radius: tuple, color: str):
         self._center = center
         self._radius = radius
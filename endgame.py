@@ -0,0 +1,245 @@
+# endgame.py
+# Siddhartha Desai
+
+import time
+import othello
+
+# Solve when at most this many squares are empty
+DEFAULT_THRESHOLD = 14
+
+# From this many empties on, moves are ordered by the opponent's mobility
+FASTEST_FIRST_EMPTIES = 6
+
+# How many nodes are solved between clock checks
+CHECK_INTERVAL = 256
+
+INFINITY = 1 << 30
+
+
+class SolveTimeout(Exception):
+    '''Raised inside the solver when the deadline passes or it is stopped'''
+    pass
+
+
+class EndgameSolver:
+    '''Exact endgame solver. Values are final disk differentials for the
+    player to move, negated in 'low' mode so that a higher value is always
+    better. Moves are ordered by the opponent's mobility (fastest first) and
+    by the parity of the quadrant they are in, and the last 3 empty squares
+    are played out without generating moves'''
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD):
+        self._threshold = threshold
+        self._sign = 1
+        self._full = 0
+        self._directions = ()
+        self._rays = []
+        self._quadrants = ()
+        self._deadline = None
+        self._next_check = 0
+        self._stopped = False
+        self._nodes = 0
+        self._elapsed = 0.0
+
+    ### Solving methods
+    def can_solve(self, game: othello.othello) -> bool:
+        '''Check if the game has few enough empty squares to be solved'''
+        return game.get_empty_count() <= self._threshold
+
+    def solve(self, game: othello.othello, mode: str = None, deadline: float = None) -> tuple:
+        '''Return the exact value of the game for the player to move and the
+        (row, col) move that reaches it, or None if the player has to pass.
+        Raises SolveTimeout if the time.perf_counter() deadline passes or
+        stop() is called first'''
+        start = time.perf_counter()
+        if mode is None:
+            mode = game.get_mode()
+        self._sign = -1 if mode == 'low' else 1
+        self._full = game.get_full_mask()
+        self._directions = game.get_directions()
+        self._rays = game.get_rays()
+        self._quadrants = _quadrant_masks(game)
+        self._deadline = deadline
+        self._next_check = CHECK_INTERVAL
+        self._stopped = False
+        self._nodes = 0
+
+        own, opp = game.get_player_masks()
+        empty = self._full & ~(own | opp)
+        count = game.get_empty_count()
+
+        best_move = None
+        best_value = -INFINITY
+        moves = othello._fill_moves(own, opp, self._full, self._directions)
+        if not moves:
+            best_value = self._solve(own, opp, empty, count, -INFINITY, INFINITY, False)
+        else:
+            for bit, flips in self._ordered_moves(own, opp, empty, moves, count):
+                value = -self._solve(opp & ~flips, own | bit | flips, empty & ~bit,
+                                     count - 1, -INFINITY, -best_value, False)
+                if value > best_value:
+                    best_value = value
+                    best_move = divmod(bit.bit_length() - 1, game.get_stride())
+
+        self._elapsed = time.perf_counter() - start
+        return best_value, best_move
+
+    def stop(self) -> None:
+        '''Make a running solve raise SolveTimeout as soon as it next checks
+        the clock. Safe to call from another thread'''
+        self._stopped = True
+
+    def _check_budget(self) -> None:
+        '''Raise SolveTimeout if the solve was stopped or the deadline passed'''
+        self._next_check = self._nodes + CHECK_INTERVAL
+        if self._stopped:
+            raise SolveTimeout()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SolveTimeout()
+
+    def _solve(self, own: int, opp: int, empty: int, count: int,
+               alpha: int, beta: int, passed: bool) -> int:
+        '''Return the value of the position for the player to move'''
+        self._nodes += 1
+        if self._nodes >= self._next_check:
+            self._check_budget()
+        if count == 1:
+            return self._last_one(own, opp, empty)
+        if count <= 3:
+            return self._last_few(own, opp, _squares(empty), alpha, beta, False)
+
+        moves = othello._fill_moves(own, opp, self._full, self._directions)
+        if not moves:
+            if passed:
+                return self._final(own, opp)
+            return -self._solve(opp, own, empty, count, -beta, -alpha, True)
+
+        best_value = -INFINITY
+        for bit, flips in self._ordered_moves(own, opp, empty, moves, count):
+            value = -self._solve(opp & ~flips, own | bit | flips, empty & ~bit,
+                                 count - 1, -beta, -alpha, False)
+            if value > best_value:
+                best_value = value
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+        return best_value
+
+    def _last_few(self, own: int, opp: int, squares: list, alpha: int,
+                  beta: int, passed: bool) -> int:
+        '''Solve 2 or 3 empty squares by trying each of them directly'''
+        self._nodes += 1
+        best_value = -INFINITY
+        for index, bit in enumerate(squares):
+            flips = othello._flips(own, opp, self._rays[bit.bit_length() - 1])
+            if not flips:
+                continue
+            rest = squares[:index] + squares[index + 1:]
+            if len(rest) == 1:
+                value = -self._last_one(opp & ~flips, own | bit | flips, rest[0])
+            else:
+                value = -self._last_few(opp & ~flips, own | bit | flips, rest,
+                                        -beta, -alpha, False)
+            if value > best_value:
+                best_value = value
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        if best_value == -INFINITY:
+            if passed:
+                return self._final(own, opp)
+            return -self._last_few(opp, own, squares, -beta, -alpha, True)
+        return best_value
+
+    def _last_one(self, own: int, opp: int, bit: int) -> int:
+        '''Solve the last empty square: the player to move takes it if they
+        can, otherwise the opponent does if they can'''
+        self._nodes += 1
+        own_count = own.bit_count()
+        opp_count = opp.bit_count()
+        flips = othello._flips(own, opp, self._rays[bit.bit_length() - 1])
+        if flips:
+            flipped = flips.bit_count()
+            return self._sign * (own_count + 1 + 2 * flipped - opp_count)
+        flips = othello._flips(opp, own, self._rays[bit.bit_length() - 1])
+        if flips:
+            flipped = flips.bit_count()
+            return self._sign * (own_count - 2 * flipped - opp_count - 1)
+        return self._sign * (own_count - opp_count)
+
+    def _final(self, own: int, opp: int) -> int:
+        '''Return the value of a finished game'''
+        return self._sign * (own.bit_count() - opp.bit_count())
+
+    def _ordered_moves(self, own: int, opp: int, empty: int, moves: int, count: int) -> list:
+        '''Return the (bit, flips) pairs of the moves. Moves in quadrants with
+        an odd number of empties come first, and with enough empties left the
+        moves that leave the opponent the fewest replies come before those'''
+        ordered = []
+        while moves:
+            bit = moves & -moves
+            moves ^= bit
+            flips = othello._flips(own, opp, self._rays[bit.bit_length() - 1])
+            even = 1
+            for quadrant in self._quadrants:
+                if bit & quadrant:
+                    even = 1 - ((empty & quadrant).bit_count() & 1)
+                    break
+            if count >= FASTEST_FIRST_EMPTIES:
+                mobility = othello._fill_moves(opp & ~flips, own | bit | flips, self._full,
+                                               self._directions).bit_count()
+            else:
+                mobility = 0
+            ordered.append((mobility, even, bit, flips))
+        ordered.sort(key = lambda item: (item[0], item[1]))
+        return [(bit, flips) for mobility, even, bit, flips in ordered]
+
+    ### Getter methods
+    def get_threshold(self) -> int:
+        '''Return the number of empties at or below which the solver is used'''
+        return self._threshold
+
+    def get_nodes(self) -> int:
+        '''Return the number of nodes of the last solve'''
+        return self._nodes
+
+    def get_elapsed(self) -> float:
+        '''Return how many seconds the last solve took'''
+        return self._elapsed
+
+
+#
+# Endgame functions
+#
+_QUADRANT_MASKS = {}
+
+def _quadrant_masks(game: othello.othello) -> tuple:
+    '''Return the masks of the 4 quadrants of the board'''
+    size = (game.get_num_rows(), game.get_num_cols())
+    quadrants = _QUADRANT_MASKS.get(size)
+    if quadrants is None:
+        half_rows = game.get_num_rows() // 2
+        half_cols = game.get_num_cols() // 2
+        masks = [0, 0, 0, 0]
+        for row in range(game.get_num_rows()):
+            for col in range(game.get_num_cols()):
+                quadrant = 2 * (row >= half_rows) + (col >= half_cols)
+                masks[quadrant] |= game.get_square_bit(row, col)
+        quadrants = tuple(masks)
+        _QUADRANT_MASKS[size] = quadrants
+    return quadrants
+
+def _squares(mask: int) -> list:
+    '''Return the single bit masks of the squares in a mask'''
+    squares = []
+    while mask:
+        bit = mask & -mask
+        mask ^= bit
+        squares.append(bit)
+    return squares
+
+def solve(game: othello.othello, mode: str = None) -> tuple:
+    '''Solve the game with a fresh solver and return (value, move)'''
+    return EndgameSolver(game.get_empty_count()).solve(game, mode)
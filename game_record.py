@@ -0,0 +1,158 @@
+# game_record.py
+# Siddhartha Desai
+
+import json
+import struct
+import othello
+
+# File header: magic and format version
+MAGIC = b'OGR1'
+FILE_HEADER = struct.Struct('>4sI')
+VERSION = 1
+
+# Game header: rows, cols, top left (0 for 'W', 1 for 'B'), first turn (0
+# for 'W', 1 for 'B'), mode (0 for 'high', 1 for 'low') and the number of
+# moves. It is followed by one byte per move.
+GAME_HEADER = struct.Struct('>BBBBBH')
+
+# Move byte of a pass. Squares are row * cols + col, so on a 16x16 board
+# the last square shares the code. Passes are forced, so a replay reads the
+# code as a pass exactly when the player to move has no legal move.
+PASS = 0xFF
+
+
+class GameRecordError(Exception):
+    '''Raised if a record file is not in the expected format'''
+    pass
+
+
+#
+# Writer class
+#
+class GameRecordWriter:
+    '''Appends games to a binary record file one at a time'''
+    def __init__(self, output):
+        '''Takes a binary file opened for writing. The file header is written
+        if the file is empty'''
+        self._output = output
+        if output.tell() == 0:
+            output.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self._games = 0
+
+    def write_game(self, rows: int, cols: int, top_left: str, turn: str,
+                   mode: str, moves: list) -> None:
+        '''Write one game. Moves are (row, col) pairs, or None for a pass'''
+        data = bytearray(GAME_HEADER.pack(rows, cols, int(top_left == 'B'),
+                                          int(turn == 'B'), int(mode == 'low'), len(moves)))
+        for move in moves:
+            if move is None:
+                data.append(PASS)
+            else:
+                data.append(move[0] * cols + move[1])
+        self._output.write(data)
+        self._games += 1
+
+    def write_record(self, record: dict) -> None:
+        '''Write a game record as made by tournament.play_game'''
+        self.write_game(record['rows'], record['cols'], record['top_left'],
+                        record['turn'], record['mode'], record['moves'])
+
+    def get_games(self) -> int:
+        '''Return how many games this writer has written'''
+        return self._games
+
+
+#
+# Reading functions
+#
+def read_games(source):
+    '''Generate a (rows, cols, top left, turn, mode, move bytes) tuple for
+    every game in a record file, given its path or a binary file. Only one
+    game is held in memory at a time'''
+    if isinstance(source, str):
+        with open(source, 'rb') as records:
+            yield from read_games(records)
+        return
+
+    header = source.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size:
+        return
+    magic, version = FILE_HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise GameRecordError('Not a version {} game record file'.format(VERSION))
+
+    while True:
+        header = source.read(GAME_HEADER.size)
+        if not header:
+            return
+        if len(header) < GAME_HEADER.size:
+            raise GameRecordError('Truncated game header')
+        rows, cols, top_left, turn, mode, count = GAME_HEADER.unpack(header)
+        moves = source.read(count)
+        if len(moves) < count:
+            raise GameRecordError('Truncated game moves')
+        yield (rows, cols, 'B' if top_left else 'W', 'B' if turn else 'W',
+               'low' if mode else 'high', moves)
+
+def read_records(path: str):
+    '''Generate a (rows, cols, top left, turn, mode, moves) tuple for every
+    game of a binary (.ogr) or JSON-lines record file. Moves are (row, col)
+    pairs, or None for a pass'''
+    if path.endswith('.ogr'):
+        for record in read_games(path):
+            yield record[:5] + (_decode_moves(record),)
+    else:
+        with open(path) as records:
+            yield from read_json_records(records)
+
+def read_json_records(lines):
+    '''Generate a (rows, cols, top left, turn, mode, moves) tuple for every
+    JSON record in lines of text, such as an open file or sys.stdin'''
+    for line in lines:
+        if line.strip():
+            record = json.loads(line)
+            yield (record['rows'], record['cols'], record['top_left'],
+                   record['turn'], record['mode'], record['moves'])
+
+def _decode_moves(game_record: tuple) -> list:
+    '''Return the move bytes of a game read by read_games as (row, col)
+    pairs, or None for a pass. On a 16x16 board the pass code is also the
+    last square, so there the game is replayed and the code is a pass when
+    the player to move has no legal move. After an illegal move the replay
+    stops and the code is read as the square'''
+    rows, cols, top_left, turn, mode, data = game_record
+    if rows * cols <= PASS:
+        return [None if code == PASS else divmod(code, cols) for code in data]
+
+    game = othello.othello(rows, cols, turn, top_left, mode)
+    moves = []
+    for code in data:
+        legal = None if game is None else othello.legal_moves(game)
+        move = None if code == PASS and legal is not None and not legal else divmod(code, cols)
+        moves.append(move)
+        if game is not None:
+            if move is None or move in legal:
+                othello.apply_move(game, move)
+            else:
+                game = None
+    return moves
+
+def replay(game_record: tuple) -> tuple:
+    '''Replay a game read by read_games through make_a_move. Returns the
+    finished othello game and its moves as (row, col) pairs, or None for a
+    pass'''
+    rows, cols, top_left, turn, mode, data = game_record
+    game = othello.othello(rows, cols, turn, top_left, mode)
+    moves = []
+    for code in data:
+        if code == PASS and not othello.legal_moves(game):
+            game.change_player()
+            moves.append(None)
+            continue
+        move = divmod(code, cols)
+        if move not in othello.legal_moves(game):
+            raise GameRecordError('Illegal move {} in game record'.format(move))
+        othello.make_a_move(game, list(move))
+        game.change_player()
+        moves.append(move)
+    return game, moves
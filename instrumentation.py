@@ -0,0 +1,159 @@
+# instrumentation.py
+# Siddhartha Desai
+
+import time
+import functools
+import othello
+
+# Functions of othello.py that are counted and timed: the move entry
+# points, legal move and status generation, the bitboard move mask, the
+# flip finder and the legacy per-square helpers. The times include the
+# functions they call, so apply_move includes its legal_moves call and
+# legal_moves its _flips calls.
+FUNCTIONS = ('make_a_move', 'apply_move', 'legal_moves', 'game_status',
+             '_fill_moves', '_flips', '_any_available_moves',
+             '_flip_horizontal_vertical', '_flip_diagonal')
+
+# Methods of the othello class that are counted and timed
+METHODS = ('place_disk', 'push_move', 'pop_move', 'update_score')
+
+_originals = {}
+_calls = {}
+_nanoseconds = {}
+_flipped = {}
+_rays = {}
+
+
+#
+# Wrapping functions
+#
+def _timed(name: str, function):
+    '''Return a wrapper that counts the calls of a function and adds up the
+    time spent in it'''
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _nanoseconds[name] += time.perf_counter_ns() - start
+            _calls[name] += 1
+    return wrapper
+
+def _counted_flips(function):
+    '''Return a wrapper of othello._flips that also records how many disks
+    each call flipped, and for each ray how many opposing disks it ran over
+    and whether they were flipped. The ray counts are taken outside the
+    timed call'''
+    timed = _timed('_flips', function)
+    @functools.wraps(function)
+    def wrapper(own: int, opp: int, rays: tuple) -> int:
+        flips = timed(own, opp, rays)
+        count = flips.bit_count()
+        _flipped[count] = _flipped.get(count, 0) + 1
+        for ray in rays:
+            length = 0
+            for square in ray:
+                if not square & opp:
+                    break
+                length += 1
+            counts = _rays.setdefault(length, [0, 0])
+            counts[0] += 1
+            if length and ray[0] & flips:
+                counts[1] += length
+        return flips
+    return wrapper
+
+
+#
+# Switching functions
+#
+def enable() -> None:
+    '''Start counting. Does nothing if already enabled'''
+    if _originals:
+        return
+    for name in FUNCTIONS:
+        _originals[name] = getattr(othello, name)
+        if name == '_flips':
+            setattr(othello, name, _counted_flips(_originals[name]))
+        else:
+            setattr(othello, name, _timed(name, _originals[name]))
+    for name in METHODS:
+        _originals[name] = getattr(othello.othello, name)
+        setattr(othello.othello, name, _timed(name, _originals[name]))
+    if not _calls:
+        reset()
+
+def disable() -> None:
+    '''Put the original functions back, so that the game core runs at full
+    speed again. The counts are kept until reset'''
+    for name, function in _originals.items():
+        if name in METHODS:
+            setattr(othello.othello, name, function)
+        else:
+            setattr(othello, name, function)
+    _originals.clear()
+
+def is_enabled() -> bool:
+    '''Return whether the game core is being counted'''
+    return bool(_originals)
+
+def reset() -> None:
+    '''Clear all counts'''
+    for name in FUNCTIONS + METHODS:
+        _calls[name] = 0
+        _nanoseconds[name] = 0
+    _flipped.clear()
+    _rays.clear()
+
+
+#
+# Export functions
+#
+def snapshot() -> dict:
+    '''Return the counts as {'functions': {name: {'calls', 'seconds'}},
+    'flipped': {disks flipped: _flips calls},
+    'rays': {length: {'rays', 'flips'}}, 'squares_scanned', 'flips'}'''
+    functions = {}
+    for name in FUNCTIONS + METHODS:
+        functions[name] = {'calls': _calls.get(name, 0),
+                           'seconds': _nanoseconds.get(name, 0) / 1e9}
+    rays = {}
+    for length in sorted(_rays):
+        rays[length] = {'rays': _rays[length][0], 'flips': _rays[length][1]}
+    return {'functions': functions,
+            'flipped': {count: _flipped[count] for count in sorted(_flipped)},
+            'rays': rays,
+            'squares_scanned': sum(length * counts[0] for length, counts in _rays.items()),
+            'flips': sum(count * calls for count, calls in _flipped.items())}
+
+def prometheus(prefix: str = 'othello') -> str:
+    '''Return the counts in the Prometheus text exposition format'''
+    data = snapshot()
+    lines = ['# HELP {}_calls_total Calls of a game core function.'.format(prefix),
+             '# TYPE {}_calls_total counter'.format(prefix)]
+    for name, counts in data['functions'].items():
+        lines.append('{}_calls_total{{function="{}"}} {}'.format(prefix, name, counts['calls']))
+    lines.extend(['# HELP {}_seconds_total Time spent in a game core function.'.format(prefix),
+                  '# TYPE {}_seconds_total counter'.format(prefix)])
+    for name, counts in data['functions'].items():
+        lines.append('{}_seconds_total{{function="{}"}} {:.9f}'.format(prefix, name, counts['seconds']))
+    lines.extend(['# HELP {}_flip_calls_total Flip finder calls, by disks flipped.'.format(prefix),
+                  '# TYPE {}_flip_calls_total counter'.format(prefix)])
+    for count, calls in data['flipped'].items():
+        lines.append('{}_flip_calls_total{{flipped="{}"}} {}'.format(prefix, count, calls))
+    lines.extend(['# HELP {}_rays_total Rays scanned for flips, by squares scanned.'.format(prefix),
+                  '# TYPE {}_rays_total counter'.format(prefix)])
+    for length, counts in data['rays'].items():
+        lines.append('{}_rays_total{{length="{}"}} {}'.format(prefix, length, counts['rays']))
+    lines.extend(['# HELP {}_ray_flips_total Disks flipped, by squares scanned.'.format(prefix),
+                  '# TYPE {}_ray_flips_total counter'.format(prefix)])
+    for length, counts in data['rays'].items():
+        lines.append('{}_ray_flips_total{{length="{}"}} {}'.format(prefix, length, counts['flips']))
+    lines.extend(['# HELP {}_squares_scanned_total Opposing squares walked over by the flip finder.'.format(prefix),
+                  '# TYPE {}_squares_scanned_total counter'.format(prefix)])
+    lines.append('{}_squares_scanned_total {}'.format(prefix, data['squares_scanned']))
+    lines.extend(['# HELP {}_flips_total Disks flipped.'.format(prefix),
+                  '# TYPE {}_flips_total counter'.format(prefix)])
+    lines.append('{}_flips_total {}'.format(prefix, data['flips']))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,307 @@
+# mcts.py
+# Siddhartha Desai
+
+import math
+import time
+import random
+import concurrent.futures
+from array import array
+import othello
+
+# Square stored for a pass move
+PASS = -1
+
+# First child value of a node whose children have not been created yet, and
+# of a node where the game is over
+UNEXPANDED = -1
+TERMINAL = -2
+
+
+#
+# Playout functions
+#
+def random_playout(own: int, opp: int, full: int, directions: tuple, rays: list,
+                   generator: random.Random) -> int:
+    '''Play random moves from the masks of the player to move and of the
+    opponent until neither can move. Return the final disk difference for the
+    player who was to move. Works on the masks only, so nothing is validated
+    and no score is kept along the way'''
+    sign = 1
+    passed = False
+    while True:
+        moves = othello._fill_moves(own, opp, full, directions)
+        if not moves:
+            if passed:
+                break
+            passed = True
+            own, opp = opp, own
+            sign = -sign
+            continue
+        passed = False
+
+        # Drop a random number of the lowest moves and play the next one
+        for skip in range(generator.randrange(moves.bit_count())):
+            moves &= moves - 1
+        bit = moves & -moves
+
+        flips = othello._flips(own, opp, rays[bit.bit_length() - 1])
+        own, opp = opp & ~flips, own | bit | flips
+        sign = -sign
+    return sign * (own.bit_count() - opp.bit_count())
+
+def _playout_batch(states: list, rows: int, cols: int, full: int, directions: tuple,
+                   seed: int) -> list:
+    '''Run one random playout from each (own, opp) state and return the disk
+    differences. Used to spread a batch over worker processes, which build
+    their own ray table for the board size'''
+    generator = random.Random(seed)
+    rays = othello._ray_table(rows, cols)
+    return [random_playout(own, opp, full, directions, rays, generator)
+            for own, opp in states]
+
+def _reward(difference: int, mode: str) -> float:
+    '''Return 1 for a win, 0.5 for a draw and 0 for a loss'''
+    if difference == 0:
+        return 0.5
+    if (difference > 0) == (mode != 'low'):
+        return 1.0
+    return 0.0
+
+
+#
+# MCTS class
+#
+class MCTSPlayer:
+    '''Monte Carlo tree search player. Nodes live in flat arrays indexed by
+    node number, and the children of a node are created together so they sit
+    next to each other. Leaves are selected in batches with a virtual loss,
+    and each batch of playouts can be shared out over a process pool'''
+    def __init__(self, exploration: float = 1.4, puct: bool = False, policy = None,
+                 batch_size: int = 1, processes: int = 0, seed: int = None):
+        self._exploration = exploration
+        self._puct = puct
+        self._policy = policy
+        self._batch_size = batch_size
+        self._generator = random.Random(seed)
+
+        self._pool = None
+        if processes:
+            self._pool = concurrent.futures.ProcessPoolExecutor(max_workers = processes)
+            self._processes = processes
+        else:
+            self._processes = 1
+
+        self._clear_tree()
+        self._playouts = 0
+        self._elapsed = 0.0
+
+    def close(self) -> None:
+        '''Shut down the playout processes'''
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def _clear_tree(self) -> None:
+        '''Remove every node'''
+        self._square = array('h')
+        self._parent = array('l')
+        self._first_child = array('l')
+        self._child_count = array('h')
+        self._visits = array('l')
+        self._total = array('d')
+        self._prior = array('d')
+
+    def _add_node(self, square: int, parent: int, prior: float) -> int:
+        '''Append a node and return its number'''
+        self._square.append(square)
+        self._parent.append(parent)
+        self._first_child.append(UNEXPANDED)
+        self._child_count.append(0)
+        self._visits.append(0)
+        self._total.append(0.0)
+        self._prior.append(prior)
+        return len(self._square) - 1
+
+    ### Search methods
+    def search(self, game: othello.othello, time_limit: float = None,
+               playouts: int = None, mode: str = None) -> tuple:
+        '''Run playouts until the time limit (in seconds) or the playout count
+        runs out and return the most visited (row, col) move, or None to pass'''
+        start = time.perf_counter()
+        if mode is None:
+            mode = game.get_mode()
+        if time_limit is None and playouts is None:
+            playouts = 1000
+        deadline = None if time_limit is None else start + time_limit
+
+        moves = othello.legal_moves(game)
+        if not moves:
+            self._elapsed = time.perf_counter() - start
+            return None
+        if len(moves) == 1:
+            self._elapsed = time.perf_counter() - start
+            return next(iter(moves))
+
+        self._clear_tree()
+        self._add_node(PASS, -1, 1.0)
+        self._playouts = 0
+        self._game = game
+        root_own, root_opp = game.get_player_masks()
+        full = game.get_full_mask()
+        directions = game.get_directions()
+        rays = game.get_rays()
+        # Expand the root before checking the budget so that a move can be
+        # returned even if no playout runs
+        self._expand(0, root_own, root_opp, full, directions)
+
+        while True:
+            if playouts is not None and self._playouts >= playouts:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+
+            # Select a batch of leaves, with a virtual loss on every path
+            batch = []
+            for count in range(self._batch_size):
+                batch.append(self._select(root_own, root_opp, full, directions, rays))
+
+            states = [(own, opp) for leaf, own, opp in batch]
+            differences = self._run_playouts(states, full, directions, rays)
+            for (leaf, own, opp), difference in zip(batch, differences):
+                self._backpropagate(leaf, _reward(-difference, mode))
+            self._playouts += len(batch)
+
+        self._elapsed = time.perf_counter() - start
+
+        # Play the most visited move, breaking ties by prior
+        first = self._first_child[0]
+        best = max(range(first, first + self._child_count[0]),
+                   key = lambda node: (self._visits[node], self._prior[node]))
+        return divmod(self._square[best], game.get_stride())
+
+    def _select(self, own: int, opp: int, full: int, directions: tuple,
+                rays: list) -> tuple:
+        '''Walk down from the root to a leaf, adding a visit to every node on
+        the way, and return the leaf with the masks of its player to move and
+        of the opponent'''
+        node = 0
+        self._visits[0] += 1
+        while True:
+            first = self._first_child[node]
+            if first == TERMINAL:
+                return node, own, opp
+            if first == UNEXPANDED:
+                if self._visits[node] > 1 or node == 0:
+                    self._expand(node, own, opp, full, directions)
+                    continue
+                return node, own, opp
+
+            node = self._best_child(node)
+            self._visits[node] += 1
+            square = self._square[node]
+            if square == PASS:
+                own, opp = opp, own
+            else:
+                bit = 1 << square
+                flips = othello._flips(own, opp, rays[square])
+                own, opp = opp & ~flips, own | bit | flips
+
+    def _expand(self, node: int, own: int, opp: int, full: int, directions: tuple) -> None:
+        '''Create the children of a node, a single pass child if the player to
+        move cannot move, or mark the node as the end of the game'''
+        moves = othello._fill_moves(own, opp, full, directions)
+        if not moves:
+            if not othello._fill_moves(opp, own, full, directions):
+                self._first_child[node] = TERMINAL
+                return
+            self._first_child[node] = self._add_node(PASS, node, 1.0)
+            self._child_count[node] = 1
+            return
+
+        squares = []
+        while moves:
+            bit = moves & -moves
+            moves ^= bit
+            squares.append(bit.bit_length() - 1)
+        priors = self._priors(squares, own, opp)
+
+        self._first_child[node] = len(self._square)
+        self._child_count[node] = len(squares)
+        for square, prior in zip(squares, priors):
+            self._add_node(square, node, prior)
+
+    def _priors(self, squares: list, own: int, opp: int) -> list:
+        '''Return the prior probability of each move, from the policy if one
+        was given and uniform otherwise'''
+        if self._policy is not None:
+            return self._policy(self._game, squares, own, opp)
+        return [1.0 / len(squares)] * len(squares)
+
+    def _best_child(self, node: int) -> int:
+        '''Return the child with the highest UCT or PUCT score. Unvisited
+        children are tried first under UCT'''
+        first = self._first_child[node]
+        parent_visits = self._visits[node]
+        visits = self._visits
+        total = self._total
+        best = first
+        best_score = -1.0
+        if self._puct:
+            scale = self._exploration * math.sqrt(parent_visits)
+            for child in range(first, first + self._child_count[node]):
+                child_visits = visits[child]
+                value = total[child] / child_visits if child_visits else 0.5
+                score = value + scale * self._prior[child] / (1 + child_visits)
+                if score > best_score:
+                    best, best_score = child, score
+        else:
+            log_visits = math.log(parent_visits)
+            for child in range(first, first + self._child_count[node]):
+                child_visits = visits[child]
+                if child_visits == 0:
+                    return child
+                score = (total[child] / child_visits +
+                         self._exploration * math.sqrt(log_visits / child_visits))
+                if score > best_score:
+                    best, best_score = child, score
+        return best
+
+    def _run_playouts(self, states: list, full: int, directions: tuple, rays: list) -> list:
+        '''Run one playout from each state, over the process pool if there is
+        one'''
+        if self._pool is None or len(states) < 2:
+            return [random_playout(own, opp, full, directions, rays, self._generator)
+                    for own, opp in states]
+
+        chunk = -(-len(states) // self._processes)
+        rows = self._game.get_num_rows()
+        cols = self._game.get_num_cols()
+        futures = [self._pool.submit(_playout_batch, states[index:index + chunk], rows, cols,
+                                     full, directions, self._generator.getrandbits(32))
+                   for index in range(0, len(states), chunk)]
+        differences = []
+        for future in futures:
+            differences.extend(future.result())
+        return differences
+
+    def _backpropagate(self, node: int, reward: float) -> None:
+        '''Add the reward, seen by the player who moved into the node, to the
+        node and its ancestors. The visits were already added on the way down'''
+        while node >= 0:
+            self._total[node] += reward
+            reward = 1.0 - reward
+            node = self._parent[node]
+
+    ### Getter methods
+    def get_playouts(self) -> int:
+        '''Return the number of playouts of the last search'''
+        return self._playouts
+
+    def get_playouts_per_second(self) -> float:
+        '''Return the playout rate of the last search'''
+        if self._elapsed > 0:
+            return self._playouts / self._elapsed
+        return 0.0
+
+    def get_node_count(self) -> int:
+        '''Return the number of nodes in the tree'''
+        return len(self._square)
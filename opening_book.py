@@ -0,0 +1,222 @@
+# opening_book.py
+# Siddhartha Desai
+
+import os
+import sys
+import mmap
+import json
+import struct
+import argparse
+import othello
+import game_record
+
+# File header: magic and format version
+MAGIC = b'OBK1'
+HEADER = struct.Struct('>4sI')
+VERSION = 1
+
+# One record per (position, move): rows, cols, top left (0 for 'W', 1 for
+# 'B'), position hash, square (row * cols + col), then the games, wins and
+# draws of the player who played the move. Big-endian so the records sort
+# by their bytes, and the first KEY_SIZE bytes identify the position.
+RECORD = struct.Struct('>BBBQHIII')
+KEY = struct.Struct('>BBBQ')
+KEY_SIZE = KEY.size
+
+# How many plies of each game go into the book by default
+DEFAULT_PLIES = 20
+
+# A move is only played from the book if it was played in at least this
+# many games and scored at least this fraction of them, a draw counting half
+DEFAULT_MIN_GAMES = 10
+DEFAULT_MIN_SCORE = 0.5
+
+
+class OpeningBookError(Exception):
+    '''Raised if a book file is not in the expected format'''
+    pass
+
+
+#
+# Opening book class
+#
+class OpeningBook:
+    '''Read-only opening book. The file is memory-mapped, so opening it costs
+    next to nothing and processes that open the same book share its pages.
+    Positions are found by binary search over the sorted records'''
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER.size:
+            self._file.close()
+            raise OpeningBookError('{} is too small to be an opening book'.format(path))
+        self._map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise OpeningBookError('{} is not a version {} opening book'.format(path, VERSION))
+        self._count = (size - HEADER.size) // RECORD.size
+
+    def close(self) -> None:
+        '''Unmap and close the book file'''
+        self._map.close()
+        self._file.close()
+
+    def __len__(self) -> int:
+        '''Return the number of records'''
+        return self._count
+
+    def records(self):
+        '''Generate every record as a (rows, cols, top left, hash, square,
+        games, wins, draws) tuple in key order'''
+        for index in range(self._count):
+            yield RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)
+
+    def _key_at(self, index: int) -> bytes:
+        '''Return the position key bytes of a record'''
+        offset = HEADER.size + index * RECORD.size
+        return self._map[offset:offset + KEY_SIZE]
+
+    def lookup(self, game: othello.othello) -> list:
+        '''Return a (move, games, wins, draws) entry for every book move of
+        the game's position'''
+        key = _position_key(game)
+
+        # Find the first record of the position
+        low = 0; high = self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        entries = []
+        cols = game.get_num_cols()
+        index = low
+        while index < self._count and self._key_at(index) == key:
+            record = RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)
+            square, games, wins, draws = record[4:]
+            entries.append((divmod(square, cols), games, wins, draws))
+            index += 1
+        return entries
+
+    def best_move(self, game: othello.othello, min_games: int = DEFAULT_MIN_GAMES,
+                  min_score: float = DEFAULT_MIN_SCORE) -> tuple:
+        '''Return the book move with the best score among those played in at
+        least min_games games and scoring at least min_score, or None if no
+        move of the position qualifies'''
+        best = None
+        best_score = -1.0
+        for move, games, wins, draws in self.lookup(game):
+            if games < max(1, min_games):
+                continue
+            score = (wins + 0.5 * draws) / games
+            if score >= min_score and score > best_score:
+                best, best_score = move, score
+        return best
+
+
+#
+# Book building functions
+#
+def _position_key(game: othello.othello) -> bytes:
+    '''Return the bytes that identify a position within a book'''
+    return KEY.pack(game.get_num_rows(), game.get_num_cols(),
+                    int(game.get_top_left() == 'B'), game.get_hash())
+
+def read_book(path: str) -> dict:
+    '''Return the records of a book file as {(rows, cols, top left, hash,
+    square): [games, wins, draws]}'''
+    stats = {}
+    book = OpeningBook(path)
+    try:
+        for record in book.records():
+            stats[record[:5]] = list(record[5:])
+    finally:
+        book.close()
+    return stats
+
+def add_game(stats: dict, record: dict, plies: int = DEFAULT_PLIES) -> None:
+    '''Replay a game record, as written by the tournament runner, and count
+    the result of each of its first plies moves'''
+    game = othello.othello(record['rows'], record['cols'], record['turn'],
+                           record['top_left'], record['mode'])
+    top_left = int(record['top_left'] == 'B')
+    for move in record['moves'][:plies]:
+        if move is None:
+            othello.apply_move(game, None)
+            continue
+        key = (record['rows'], record['cols'], top_left, game.get_hash(),
+               move[0] * record['cols'] + move[1])
+        counts = stats.setdefault(key, [0, 0, 0])
+        counts[0] += 1
+        if record['winner'] == game.current_turn():
+            counts[1] += 1
+        elif record['winner'] == 'WB':
+            counts[2] += 1
+        othello.apply_move(game, move)
+
+def _record_from_binary(record: tuple) -> dict:
+    '''Replay a binary game record into the dict that add_game reads'''
+    rows, cols, top_left, turn, mode, data = record
+    game, moves = game_record.replay(record)
+    return {'rows': rows, 'cols': cols, 'top_left': top_left, 'turn': turn,
+            'mode': mode, 'moves': moves,
+            'winner': othello.winning_player(game, True, mode)}
+
+def write_book(stats: dict, path: str) -> None:
+    '''Write the records sorted by key. The book is written to a temporary
+    file first and then moved over the old one, so readers that still have
+    the old book mapped are not disturbed'''
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as book:
+        book.write(HEADER.pack(MAGIC, VERSION))
+        for key in sorted(stats):
+            book.write(RECORD.pack(*key, *stats[key]))
+    os.replace(temporary, path)
+
+def build_book(record_paths: list, path: str, plies: int = DEFAULT_PLIES,
+               extend: bool = True) -> int:
+    '''Build the book at path from JSON-lines or binary (.ogr) game record
+    files, adding to the existing book if there is one and extend is set.
+    Returns the number of games added'''
+    if extend and os.path.exists(path):
+        stats = read_book(path)
+    else:
+        stats = {}
+
+    games = 0
+    for record_path in record_paths:
+        if record_path.endswith('.ogr'):
+            for record in game_record.read_games(record_path):
+                add_game(stats, _record_from_binary(record), plies)
+                games += 1
+            continue
+        with open(record_path) as records:
+            for line in records:
+                if line.strip():
+                    add_game(stats, json.loads(line), plies)
+                    games += 1
+
+    write_book(stats, path)
+    return games
+
+
+def main(arguments: list = None) -> None:
+    '''Build or extend an opening book from the command line'''
+    parser = argparse.ArgumentParser(description = 'Build an Othello opening book.')
+    parser.add_argument('book')
+    parser.add_argument('records', nargs = '+', help = 'JSON-lines or .ogr game record files')
+    parser.add_argument('--plies', type = int, default = DEFAULT_PLIES)
+    parser.add_argument('--new', action = 'store_true', help = 'replace the book instead of extending it')
+    args = parser.parse_args(arguments)
+
+    games = build_book(args.records, args.book, args.plies, not args.new)
+    book = OpeningBook(args.book)
+    print('Added {} games, {} records in {}'.format(games, len(book), args.book), file = sys.stderr)
+    book.close()
+
+
+if __name__ == '__main__':
+    main()
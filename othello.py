@@ -1,6 +1,21 @@
 # othello.py
 # Siddhartha Desai
 
+import random
+import struct
+
+# Header of a compact game state: rows, cols, turn (0 for 'W', 1 for 'B'),
+# top left (0 for 'W', 1 for 'B') and mode (0 for 'high', 1 for 'low'). It
+# is followed by the white and the black bitboards, each STATE_MASK_SIZE
+# bytes long for the board size.
+STATE_HEADER = struct.Struct('>BBBBB')
+
+# Game statuses: the player to move has a move, has to pass, or neither
+# player can move and the game is over
+ONGOING = 'ongoing'
+MUST_PASS = 'must pass'
+FINISHED = 'finished'
+
 #
 # Othello Errors
 #
@@ -21,12 +36,23 @@ class OthelloNoValidMoves(Exception):
     '''Raised if there are no more valid moves for the current player'''
     pass
 
+class OthelloInvalidMoveError(Exception):
+    '''Raised if the user tries to apply a move that does not flip any pieces'''
+    pass
+
 
 #
 # Othello class
 # 
 class othello:
-    def __init__(self, rows, cols, turn, top_left):
+    # Fixed fields keep every live position small
+    __slots__ = ('_num_rows', '_num_cols', '_player_turn', '_top_left', '_board',
+                 '_white_score', '_black_score', '_empty_count', '_stride', '_full',
+                 '_white', '_black', '_directions', '_rays', '_moves_cache', '_undo_stack',
+                 '_white_keys', '_black_keys', '_turn_key', '_mode_key', '_mode', '_hash',
+                 '_patterns', '_status')
+
+    def __init__(self, rows, cols, turn, top_left, mode = 'high'):
         '''othello class constructor'''
         # Check if dimensions are valid
         self._check_valid_dimensions(rows, cols)
@@ -35,20 +61,102 @@ class othello:
         self._num_rows = rows
         self._num_cols = cols
         self._player_turn = turn
-        self._white_score = 2
-        self._black_score = 2
-        self._board = []
+        self._top_left = top_left
+        self._board = None
+
+        # Disk counts, kept up to date as pieces are placed and flipped
+        self._white_score = 0
+        self._black_score = 0
+        self._empty_count = rows * cols
+
+        # Bitboards: one int mask per color. Square (row, col) is bit
+        # row * stride + col, where the stride leaves one always-empty guard
+        # column so that shifted masks never wrap onto the next row.
+        self._stride = cols + 1
+        self._full = 0
+        self._white = 0
+        self._black = 0
+        self._directions = ()
+
+        # Square bits along the 8 rays from every square, shared per size
+        self._rays = _ray_table(rows, cols)
+
+        # Legal moves of each color, kept until the board changes, and the
+        # status of the game, kept until the board or the turn changes
+        self._moves_cache = {}
+        self._status = None
+
+        # One (bit, flips, turn, white delta, black delta, moves cache, hash)
+        # record per move played with push_move, newest last
+        self._undo_stack = []
+
+        # Zobrist hash of the squares, the side to move and the scoring mode
+        self._white_keys, self._black_keys, self._turn_key, self._mode_key = \
+            _zobrist_keys(rows, cols)
+        self._mode = mode
+        self._hash = 0
+        if turn == 'B':
+            self._hash ^= self._turn_key
+        if mode == 'low':
+            self._hash ^= self._mode_key
+
+        # Optional pattern indices, kept up to date like the hash
+        self._patterns = None
 
         # Create a new starting board
         self._create_board(top_left)
 
+    ### Copying methods
+    def clone(self) -> 'othello':
+        '''Return an independent copy of the game, undo stack included. The
+        tables of the board size are shared, not copied'''
+        game = othello.__new__(othello)
+        for name in othello.__slots__:
+            setattr(game, name, getattr(self, name))
+        game._board = None
+        game._moves_cache = dict(self._moves_cache)
+        game._undo_stack = list(self._undo_stack)
+        if self._patterns is not None:
+            game._patterns = self._patterns.clone()
+        return game
+
+    def to_bytes(self) -> bytes:
+        '''Return the compact state of the position: the STATE_HEADER
+        followed by the two bitboards. The undo stack is not included'''
+        size = _mask_size(self._num_rows, self._num_cols)
+        return (STATE_HEADER.pack(self._num_rows, self._num_cols, int(self._player_turn == 'B'),
+                                  int(self._top_left == 'B'), int(self._mode == 'low')) +
+                self._white.to_bytes(size, 'big') + self._black.to_bytes(size, 'big'))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'othello':
+        '''Rebuild a game from the compact state made by to_bytes'''
+        rows, cols, turn, top_left, mode = STATE_HEADER.unpack_from(data)
+        size = _mask_size(rows, cols)
+        start = STATE_HEADER.size
+        if len(data) != start + 2 * size:
+            raise ValueError('Game state must be {} bytes long'.format(start + 2 * size))
+        game = cls(rows, cols, 'B' if turn else 'W', 'B' if top_left else 'W',
+                   'low' if mode else 'high')
+        game.set_position(int.from_bytes(data[start:start + size], 'big'),
+                          int.from_bytes(data[start + size:], 'big'), game.current_turn())
+        return game
+
+    def __reduce__(self) -> tuple:
+        '''Pickle the game as its compact state'''
+        return (othello.from_bytes, (self.to_bytes(),))
+
     ### Setting up board functions    
     def _create_board(self, top_left: str) -> None:
         '''Create an empty board and then fill it with the middle 4 pieces'''
-        for col in range(self._num_cols):
-            self._board.append([])
-            for row in range(self._num_rows):
-                self._board[-1].append([])
+        row_mask = (1 << self._num_cols) - 1
+        for row in range(self._num_rows):
+            self._full |= row_mask << (row * self._stride)
+
+        # Orthogonal shifts first, then diagonal shifts
+        stride = self._stride
+        self._directions = (1, -1, stride, -stride,
+                            stride + 1, -stride - 1, stride - 1, -stride + 1)
     
         self._fill_starting_pieces(top_left)
 
@@ -59,20 +167,20 @@ class othello:
         _half_cols = int(self._num_cols/2)     
 
         if top_left == 'W':
-            self._board[_half_cols - 1][_half_rows - 1] = 'W'
-            self._board[_half_cols - 1][_half_rows] = 'B'
-            self._board[_half_cols][_half_rows - 1] = 'B'
-            self._board[_half_cols][_half_rows] = 'W'
+            self.set_board([_half_cols - 1, _half_rows - 1], 'W')
+            self.set_board([_half_cols - 1, _half_rows], 'B')
+            self.set_board([_half_cols, _half_rows - 1], 'B')
+            self.set_board([_half_cols, _half_rows], 'W')
         else:
-            self._board[_half_cols - 1][_half_rows - 1] = 'B'
-            self._board[_half_cols - 1][_half_rows] = 'W'
-            self._board[_half_cols][_half_rows - 1] = 'W'
-            self._board[_half_cols][_half_rows] = 'B'
+            self.set_board([_half_cols - 1, _half_rows - 1], 'B')
+            self.set_board([_half_cols - 1, _half_rows], 'W')
+            self.set_board([_half_cols, _half_rows - 1], 'W')
+            self.set_board([_half_cols, _half_rows], 'B')
 
     def _check_valid_dimensions(self, num_rows, num_cols) -> None:
         '''Check if the board dimensions that were specified are valid'''
         if num_rows % 2 != 0 and num_cols % 2 != 0:
-            raise OthelloNotEvenError('Number of rows and columns needs to be an even integer.')
+            raise OthelloDimensionError('Number of rows and columns needs to be an even integer.')
         if num_rows < 4 or num_rows > 16 or \
            num_cols < 4 or num_cols > 16:
             raise OthelloDimensionError('Number of rows and columns must be between 4 and 16')
@@ -82,7 +190,139 @@ class othello:
     def set_board(self, location: list, turn: str) -> None:
         '''Given a location, place the proper turn in it'''
         x = location[0]; y = location[1]
-        self._board[x][y] = turn
+        bit = 1 << (y * self._stride + x)
+
+        # Take the previous piece off the counts and the hash
+        index = y * self._stride + x
+        if self._white & bit:
+            self._white_score -= 1
+            self._hash ^= self._white_keys[index]
+        elif self._black & bit:
+            self._black_score -= 1
+            self._hash ^= self._black_keys[index]
+        else:
+            self._empty_count -= 1
+
+        if turn == 'W':
+            self._white_score += 1
+            self._hash ^= self._white_keys[index]
+            self._white |= bit
+            self._black &= ~bit
+        elif turn == 'B':
+            self._black_score += 1
+            self._hash ^= self._black_keys[index]
+            self._black |= bit
+            self._white &= ~bit
+        else:
+            self._empty_count += 1
+            self._white &= ~bit
+            self._black &= ~bit
+        if self._patterns is not None:
+            self._patterns.reset(self._white, self._black)
+        if self._board is not None:
+            self._board[x][y] = turn if turn in ('W', 'B') else []
+        self._moves_cache = {}
+        self._status = None
+
+    def place_disk(self, bit: int, flips: int) -> None:
+        '''Place the current player's disk on the given square bit and flip
+        every disk in the flips mask'''
+        flipped = flips.bit_count()
+        if self._player_turn == 'W':
+            self._white |= bit | flips
+            self._black &= ~flips
+            self._white_score += 1 + flipped
+            self._black_score -= flipped
+            own_keys = self._white_keys
+        else:
+            self._black |= bit | flips
+            self._white &= ~flips
+            self._black_score += 1 + flipped
+            self._white_score -= flipped
+            own_keys = self._black_keys
+        self._empty_count -= 1
+        if self._patterns is not None:
+            self._patterns.place(bit, flips, self._player_turn)
+
+        # A flipped disk leaves one color and joins the other. The board list
+        # of get_board, if built, is changed in place square by square
+        white_keys = self._white_keys; black_keys = self._black_keys
+        board = self._board; stride = self._stride; turn = self._player_turn
+        index = bit.bit_length() - 1
+        key = own_keys[index]
+        if board is not None:
+            board[index % stride][index // stride] = turn
+        while flips:
+            flip = flips & -flips
+            flips ^= flip
+            index = flip.bit_length() - 1
+            key ^= white_keys[index] ^ black_keys[index]
+            if board is not None:
+                board[index % stride][index // stride] = turn
+        self._hash ^= key
+        self._moves_cache = {}
+        self._status = None
+
+    def push_move(self, bit: int, flips: int) -> None:
+        '''Place the current player's disk on the given square bit (or pass if
+        the bit is 0), flip the pieces in the flips mask and hand the turn to
+        the opposite player. The change is recorded so pop_move can undo it'''
+        flipped = flips.bit_count()
+        if bit == 0:
+            white_delta = black_delta = 0
+        elif self._player_turn == 'W':
+            white_delta = 1 + flipped; black_delta = -flipped
+        else:
+            white_delta = -flipped; black_delta = 1 + flipped
+        self._undo_stack.append((bit, flips, self._player_turn, white_delta,
+                                 black_delta, self._moves_cache, self._hash))
+        if bit:
+            self.place_disk(bit, flips)
+        self.change_player()
+
+    def pop_move(self) -> tuple:
+        '''Undo the last move recorded by push_move and return its square bit
+        and flips mask. Raises IndexError if there is no move to undo'''
+        bit, flips, turn, white_delta, black_delta, moves_cache, hash_key = \
+            self._undo_stack.pop()
+        self._player_turn = turn
+        self._hash = hash_key
+        if bit:
+            if turn == 'W':
+                self._white &= ~(bit | flips)
+                self._black |= flips
+            else:
+                self._black &= ~(bit | flips)
+                self._white |= flips
+            self._white_score -= white_delta
+            self._black_score -= black_delta
+            self._empty_count += 1
+            if self._patterns is not None:
+                self._patterns.remove(bit, flips, turn)
+            board = self._board
+            if board is not None:
+                stride = self._stride
+                index = bit.bit_length() - 1
+                board[index % stride][index // stride] = []
+                opposite = 'B' if turn == 'W' else 'W'
+                rest = flips
+                while rest:
+                    flip = rest & -rest
+                    rest ^= flip
+                    index = flip.bit_length() - 1
+                    board[index % stride][index // stride] = opposite
+        self._moves_cache = moves_cache
+        self._status = None
+        return bit, flips
+
+    def set_cached_moves(self, moves: dict) -> None:
+        '''Remember the legal moves of the current player'''
+        self._moves_cache[self._player_turn] = moves
+
+    def set_cached_move_mask(self, first: int, mask: int) -> None:
+        '''Remember the mask of the current player's moves that flip along the
+        group of directions starting at index first'''
+        self._moves_cache[(self._player_turn, first)] = mask
 
     def change_player(self) -> None:
         '''Changes the current player to the opposite player'''
@@ -90,19 +330,60 @@ class othello:
             self._player_turn = 'B'
         else:
             self._player_turn = 'W'
+        self._hash ^= self._turn_key
+        self._status = None
+
+    def set_mode(self, mode: str) -> None:
+        '''Set the scoring mode, 'high' or 'low', that the game is played in'''
+        if (mode == 'low') != (self._mode == 'low'):
+            self._hash ^= self._mode_key
+        self._mode = mode
+        self._status = None
+
+    def set_position(self, white: int, black: int, turn: str) -> None:
+        '''Replace the disks with the given masks and set the current player.
+        The cached moves and the undo stack are cleared'''
+        self._white = white
+        self._black = black
+        self._player_turn = turn
+        self.update_score()
+
+        self._hash = 0
+        bits = white | black
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            index = bit.bit_length() - 1
+            if white & bit:
+                self._hash ^= self._white_keys[index]
+            else:
+                self._hash ^= self._black_keys[index]
+        if turn == 'B':
+            self._hash ^= self._turn_key
+        if self._mode == 'low':
+            self._hash ^= self._mode_key
+        if self._patterns is not None:
+            self._patterns.reset(white, black)
+
+        self._board = None
+        self._moves_cache = {}
+        self._status = None
+        self._undo_stack = []
+
+    def set_patterns(self, patterns) -> None:
+        '''Attach pattern indices, or None to detach them. The indices are
+        reset to the current position and from then on updated with every
+        disk placed, flipped or taken back'''
+        self._patterns = patterns
+        if patterns is not None:
+            patterns.reset(self._white, self._black)
 
     def update_score(self) -> None:
-        '''Update the the scores'''
-        white_score = 0
-        black_score = 0
-        for row in range(self._num_rows):
-            for col in range(self._num_cols):
-                if self._board[col][row] == 'W':
-                    white_score += 1
-                if self._board[col][row] == 'B':
-                    black_score += 1
-        self._white_score = white_score
-        self._black_score = black_score
+        '''Update the the scores. The counts are already kept up to date as
+        disks are placed, so this only recounts them from the bitboards'''
+        self._white_score = self._white.bit_count()
+        self._black_score = self._black.bit_count()
+        self._empty_count = (self._full & ~(self._white | self._black)).bit_count()
         
 
     ### Getter Methods
@@ -118,7 +399,23 @@ class othello:
             return 'W'
 
     def get_board(self) -> list:
-        '''Return the board'''
+        '''Return the board as a list of columns, each a list of 'W', 'B' or
+        [] for an empty square. The list is built from the bitboards on the
+        first call and from then on changed in place as disks are placed,
+        flipped and taken back'''
+        if self._board is None:
+            board = []
+            for col in range(self._num_cols):
+                board.append([])
+                for row in range(self._num_rows):
+                    bit = 1 << (row * self._stride + col)
+                    if self._white & bit:
+                        board[-1].append('W')
+                    elif self._black & bit:
+                        board[-1].append('B')
+                    else:
+                        board[-1].append([])
+            self._board = board
         return self._board
 
     def get_num_rows(self) -> int:
@@ -136,11 +433,94 @@ class othello:
     def get_black_score(self) -> int:
         '''Return the black player's score'''
         return self._black_score
+
+    def get_top_left(self) -> str:
+        '''Return the color of the top left starting piece'''
+        return self._top_left
+
+    def get_mode(self) -> str:
+        '''Return the scoring mode'''
+        return self._mode
+
+    def get_hash(self) -> int:
+        '''Return the 64-bit Zobrist hash of the position'''
+        return self._hash
+
+    def get_mode_key(self) -> int:
+        '''Return the Zobrist key that is in the hash in 'low' mode'''
+        return self._mode_key
+
+    def get_empty_count(self) -> int:
+        '''Return the number of empty squares'''
+        return self._empty_count
+
+    def get_undo_depth(self) -> int:
+        '''Return the number of moves that can be undone'''
+        return len(self._undo_stack)
+
+    def get_stride(self) -> int:
+        '''Return the number of bits between vertically adjacent squares'''
+        return self._stride
+
+    def get_directions(self) -> tuple:
+        '''Return the bit shifts of the 8 directions, orthogonal ones first'''
+        return self._directions
+
+    def get_rays(self) -> list:
+        '''Return the ray table of the board size, indexed by bit position'''
+        return self._rays
+
+    def get_patterns(self):
+        '''Return the attached pattern indices, or None'''
+        return self._patterns
+
+    def get_full_mask(self) -> int:
+        '''Return the mask of every square on the board'''
+        return self._full
+
+    def get_white_mask(self) -> int:
+        '''Return the mask of the white disks'''
+        return self._white
+
+    def get_black_mask(self) -> int:
+        '''Return the mask of the black disks'''
+        return self._black
+
+    def get_player_masks(self) -> tuple:
+        '''Return the masks of the current player and the opposite player'''
+        if self._player_turn == 'W':
+            return self._white, self._black
+        else:
+            return self._black, self._white
+
+    def get_cached_moves(self) -> dict:
+        '''Return the remembered legal moves of the current player, or None
+        if they have not been generated since the board last changed'''
+        return self._moves_cache.get(self._player_turn)
+
+    def get_cached_move_mask(self, first: int) -> int:
+        '''Return the remembered move mask of the current player for the group
+        of directions starting at index first, or None'''
+        return self._moves_cache.get((self._player_turn, first))
+
+    def get_cached_status(self) -> tuple:
+        '''Return the remembered (status, winner) of the game, or None if it
+        has not been worked out since the board or the turn last changed'''
+        return self._status
+
+    def set_cached_status(self, status: tuple) -> None:
+        '''Remember the (status, winner) of the game'''
+        self._status = status
+
+    def get_square_bit(self, row: int, col: int) -> int:
+        '''Return the mask with only the given square set'''
+        return 1 << (row * self._stride + col)
     
     
     ### Helper methods to print out variables of the board
     def print_board(self) -> None:
         '''Print the board'''
+        board = self.get_board()
         print('    ', end='')
         for column in range(1, self._num_cols + 1):
             if column < 10:
@@ -152,10 +532,10 @@ class othello:
         for row in range(self._num_rows):
             print('{:2} '.format(row+1), end='')
             for col in range(self._num_cols):
-                if len(self._board[col][row]) == 0:
+                if len(board[col][row]) == 0:
                     print('[ ]', end='')
                 else:
-                    print('[{}]'.format(self._board[col][row]), end='')
+                    print('[{}]'.format(board[col][row]), end='')
             if col == self._num_cols - 1:
                 print()
 
@@ -175,18 +555,93 @@ class othello:
 def make_a_move(game: othello, location: list) -> None:
     '''Checks if the location is not out of bounds and not already filled. It
     then checks if the board changed, if it didn't, then make sure that the
-    same player repeats his move. At the end, update the score'''
+    same player repeats his move. The scores are updated as the disks are
+    placed'''
     _require_valid_row_col_number(game, location[0], location[1])
     _is_empty(game, location)
 
-    changed = _flip(game, location)
-    if not changed:
+    flips = legal_moves(game).get((location[0], location[1]))
+    if flips:
+        game.place_disk(game.get_square_bit(location[0], location[1]), flips)
+    else:
         # print("Not a valid move. Still player {}'s turn.".format(game.current_turn()))
         game.change_player()
-        
-    game.update_score()
     
 
+def apply_move(game: othello, location: list) -> None:
+    '''Play a legal move for the current player and give the turn to the
+    opposite player. If the location is None, the current player passes. The
+    move goes on the game's undo stack so undo_move can take it back'''
+    if location is None:
+        game.push_move(0, 0)
+        return
+    flips = legal_moves(game).get((location[0], location[1]))
+    if not flips:
+        raise OthelloInvalidMoveError()
+    game.push_move(game.get_square_bit(location[0], location[1]), flips)
+
+def undo_move(game: othello) -> None:
+    '''Take back the last move played with apply_move, restoring the board,
+    the scores and the turn'''
+    game.pop_move()
+
+
+### Hashing functions
+_ZOBRIST_TABLES = {}
+
+def _zobrist_keys(rows: int, cols: int) -> tuple:
+    '''Return the (white keys, black keys, turn key, mode key) Zobrist table
+    for a board size. The square keys are indexed by bit position. Tables are
+    built once per size from a fixed seed, so hashes agree across processes'''
+    table = _ZOBRIST_TABLES.get((rows, cols))
+    if table is None:
+        generator = random.Random(rows * 100 + cols)
+        size = rows * (cols + 1)
+        white_keys = [generator.getrandbits(64) for index in range(size)]
+        black_keys = [generator.getrandbits(64) for index in range(size)]
+        table = (white_keys, black_keys,
+                 generator.getrandbits(64), generator.getrandbits(64))
+        _ZOBRIST_TABLES[(rows, cols)] = table
+    return table
+
+
+### State functions
+def _mask_size(rows: int, cols: int) -> int:
+    '''Return the number of bytes of one bitboard in a compact state'''
+    return (rows * (cols + 1) + 7) // 8
+
+
+### Ray tables
+_RAY_TABLES = {}
+
+def _ray_table(rows: int, cols: int) -> list:
+    '''Return the ray table for a board size. Entry i holds, for the square
+    at bit position i, a tuple of the 8 rays in the order of the directions,
+    each a tuple of the square bits met walking away from the square up to
+    the edge of the board. Guard column entries are None. Tables are built
+    once per size'''
+    table = _RAY_TABLES.get((rows, cols))
+    if table is None:
+        stride = cols + 1
+        steps = ((0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (-1, -1), (1, -1), (-1, 1))
+        table = [None] * (rows * stride)
+        for row in range(rows):
+            for col in range(cols):
+                rays = []
+                for row_step, col_step in steps:
+                    ray = []
+                    ray_row = row + row_step
+                    ray_col = col + col_step
+                    while 0 <= ray_row < rows and 0 <= ray_col < cols:
+                        ray.append(1 << (ray_row * stride + ray_col))
+                        ray_row += row_step
+                        ray_col += col_step
+                    rays.append(tuple(ray))
+                table[row * stride + col] = tuple(rays)
+        _RAY_TABLES[(rows, cols)] = table
+    return table
+
+
 ### Checking functions
 def _require_valid_row_col_number(game: othello, row_num: int, col_num: int):
     '''Checks if the location is inside the board's dimensions'''
@@ -219,18 +674,34 @@ def _valid_col_number(game: othello, col_num: int) -> bool:
 
 def _is_empty(game: othello, location: list) -> None:
     '''Raises an exception if the location is not empty'''
-    if len(game.get_board()[location[1]][location[0]]) != 0:
+    bit = game.get_square_bit(location[0], location[1])
+    if (game.get_white_mask() | game.get_black_mask()) & bit:
         raise OthelloNotEmptyError()
 
 
 ### Winning functions
+def game_status(game: othello) -> tuple:
+    '''Return the (status, winner) of the game. The status is ONGOING if the
+    current player has a move, MUST_PASS if only the opposite player has one,
+    and FINISHED if neither has, in which case the winner is 'W', 'B' or 'WB'
+    under the game's mode. Otherwise the winner is None. The status is
+    cached on the game until the board or the turn changes'''
+    status = game.get_cached_status()
+    if status is None:
+        if legal_moves(game):
+            status = (ONGOING, None)
+        else:
+            own, opp = game.get_player_masks()
+            if _fill_moves(opp, own, game.get_full_mask(), game.get_directions()):
+                status = (MUST_PASS, None)
+            else:
+                status = (FINISHED, winning_player(game, True, game.get_mode()))
+        game.set_cached_status(status)
+    return status
+
 def is_board_full(game: othello) -> bool:
     '''Checks if the board is full'''
-    for row in range(game.get_num_rows()):
-        for col in range(game.get_num_cols()):
-            if len(game.get_board()[col][row]) == 0:
-                return False
-    return True
+    return game.get_empty_count() == 0
 
 
 def winning_player(game: othello, full: bool, mode: str) -> str:
@@ -256,191 +727,152 @@ def winning_player(game: othello, full: bool, mode: str) -> str:
             return
     return
 
+def legal_moves(game: othello) -> dict:
+    '''Return a dict that maps every legal (row, col) move of the current
+    player to the mask of the pieces it flips. The moves are generated in one
+    sweep and cached on the game until the board changes, so the returned
+    dict must not be modified'''
+    moves = game.get_cached_moves()
+    if moves is None:
+        moves = {}
+        stride = game.get_stride()
+        own, opp = game.get_player_masks()
+        rays = game.get_rays()
+        move_mask = _legal_move_mask(game)
+        while move_mask:
+            bit = move_mask & -move_mask
+            move_mask ^= bit
+            index = bit.bit_length() - 1
+            moves[divmod(index, stride)] = _flips(own, opp, rays[index])
+        game.set_cached_moves(moves)
+    return moves
+
 def _any_available_moves(game: othello) -> bool:
     '''Checks if there are any available moves'''
-    game_board = game.get_board()
-    for row in range(game.get_num_rows()):
-        for col in range(game.get_num_cols()):
-            if len(game_board[col][row]) == 0:
-                check1 = _flip_horizontal_vertical(game, [row, col], False)
-                check2 = _flip_diagonal(game, [row, col], False)
-                
-                if check1 or check2:
-                    return True
-    return False
+    return len(legal_moves(game)) != 0
     
 
 ### Functions to flip pieces on the board when a move is made
-def _flip(game, location) -> bool:
-    '''Checks if there are any pieces to flip'''
-    check1 = _flip_horizontal_vertical(game, location, True)
-    check2 = _flip_diagonal(game, location, True)
-
-    return check1 or check2:
-
-def _flip_horizontal_vertical(game: othello, location: list, value: bool) -> bool:
-    '''Scans the horizontal and vertical directions for pieces to flip'''
-    game_board = game.get_board()
-    x = location[0]; y = location[1]
-    hori_left_list = []; hori_right_list = []
-    verti_up_list = []; verti_down_list = []
-    flip_list = []
-
-    # Horizontal Left
-    left_y = y-1
-    if left_y >= 0:
-        while game_board[left_y][x] == game.opposite_turn():
-            # print('Horizontal Left')
-            hori_left_list.append([left_y, x])
-            left_y -= 1
-            if left_y < 0:
-                hori_left_list = []
-                break
-        
-    # Horizontal Right
-    right_y = y+1
-    if right_y < game.get_num_cols():
-        while game_board[right_y][x] == game.opposite_turn():
-            # print('Horizontal Right')
-            hori_right_list.append([right_y, x])
-            right_y += 1
-            if right_y >= game.get_num_cols():
-                hori_right_list = []
-                break
-
-    # Vertical Up
-    up_x = x-1
-    if up_x >= 0:
-        while game_board[y][up_x] == game.opposite_turn():
-            # print('Vertical Up')
-            verti_up_list.append([y, up_x])
-            up_x -= 1
-            if up_x < 0:
-                verti_up_list = []
-                break
-
-    # Vertical Down
-    down_x = x+1
-    if down_x < game.get_num_rows():
-        while game_board[y][down_x] == game.opposite_turn():
-            # print('Vertical Down')
-            verti_down_list.append([y, down_x])
-            down_x += 1
-            if down_x >= game.get_num_rows():
-                verti_down_list = []
+def _shift(bits: int, amount: int) -> int:
+    '''Shift a mask by a signed number of squares'''
+    if amount > 0:
+        return bits << amount
+    return bits >> -amount
+
+def _legal_move_mask(game: othello) -> int:
+    '''Return the mask of every empty square where the current player flips
+    at least one piece'''
+    own, opp = game.get_player_masks()
+    return _fill_moves(own, opp, game.get_full_mask(), game.get_directions())
+
+def _fill_moves(own: int, opp: int, full: int, directions: tuple) -> int:
+    '''Return the mask of every empty square where the own disks flip at
+    least one of the opposing disks. Each direction is filled from the own
+    disks across runs of opposing disks, one square per step, until the
+    newest squares of the runs are no longer opposing disks'''
+    empty = full & ~(own | opp)
+    moves = 0
+    for direction in directions:
+        if direction > 0:
+            run = frontier = (own << direction) & opp
+            while frontier:
+                frontier = (frontier << direction) & opp
+                run |= frontier
+            moves |= (run << direction) & empty
+        else:
+            direction = -direction
+            run = frontier = (own >> direction) & opp
+            while frontier:
+                frontier = (frontier >> direction) & opp
+                run |= frontier
+            moves |= (run >> direction) & empty
+    return moves
+
+def _fill_flips(own: int, opp: int, bit: int, directions: tuple) -> int:
+    '''Return the mask of the opposing disks that an own disk on the given
+    square bit would flip along the given directions. Each direction is
+    filled from the square across the run of opposing disks like
+    _fill_moves, and the run flips if an own disk ends it'''
+    flips = 0
+    for direction in directions:
+        if direction > 0:
+            run = frontier = (bit << direction) & opp
+            while frontier:
+                frontier = (frontier << direction) & opp
+                run |= frontier
+            if (run << direction) & own:
+                flips |= run
+        else:
+            direction = -direction
+            run = frontier = (bit >> direction) & opp
+            while frontier:
+                frontier = (frontier >> direction) & opp
+                run |= frontier
+            if (run >> direction) & own:
+                flips |= run
+    return flips
+
+def _flip_mask(game: othello, bit: int, directions: slice = slice(None)) -> int:
+    '''Return the mask of the pieces that a disk on the given square bit
+    would flip along the directions picked by the slice (all 8 by default)'''
+    own, opp = game.get_player_masks()
+    return _fill_flips(own, opp, bit, game.get_directions()[directions])
+
+def _flips(own: int, opp: int, rays: tuple) -> int:
+    '''Return the mask of the opposing disks that an own disk would flip
+    along the given rays from its square, as found in the ray table. Each
+    ray is walked over the opposing disks until the first other square'''
+    flips = 0
+    for ray in rays:
+        run = 0
+        for square in ray:
+            if square & opp:
+                run |= square
+            else:
+                if square & own:
+                    flips |= run
                 break
+    return flips
 
-    # Only add the list if the next piece in the direction is the same
-    if len(hori_left_list) != 0 and left_y >= 0:
-        if game_board[left_y][x] == game.current_turn():
-            flip_list.extend(hori_left_list)
-    if len(hori_right_list) != 0 and right_y < game.get_num_cols():
-        if game_board[right_y][x] == game.current_turn():
-            flip_list.extend(hori_right_list)
-    if len(verti_up_list) != 0 and up_x >= 0:
-        if game_board[y][up_x] == game.current_turn():
-            flip_list.extend(verti_up_list)
-    if len(verti_down_list) != 0 and down_x < game.get_num_rows():
-        if game_board[y][down_x] == game.current_turn():
-            flip_list.extend(verti_down_list)
-
-    # If value is True, set the board and flip the pieces
-    if len(flip_list) != 0 and value:    
-        game.set_board([y, x], game.current_turn())
-        _flip_pieces(game, flip_list, game.current_turn())
+def _flip(game, location) -> bool:
+    '''Checks if there are any pieces to flip, and flips them if so'''
+    bit = game.get_square_bit(location[0], location[1])
+    flips = _flip_mask(game, bit)
+    if flips:
+        game.place_disk(bit, flips)
         return True
-    # If the value is False, just check if there are pieces to be flipped
-    if not value:
-        if len(flip_list) == 0:
-            return False
-        else:
-            return True
     return False
 
-def _flip_diagonal(game: othello, location: list, value = bool) -> bool:
-    '''Scans the diagonal directions for pieces to flip'''
-    game_board = game.get_board()
-    x = location[0]; y = location[1]
-    north_west_list = []; south_east_list = []
-    north_east_list = []; south_west_list = []
-    flip_list =  []
-
-    # North West
-    nw_x = x-1; nw_y = y-1
-    if nw_x >= 0 and nw_y >= 0:
-        while game_board[nw_y][nw_x] == game.opposite_turn():
-            # print('North West')
-            north_west_list.append([nw_y, nw_x])
-            nw_x -= 1; nw_y -= 1
-            if nw_x < 0 or nw_y < 0:
-                north_west_list = []
-                break
-
-    # South East
-    se_x = x+1; se_y = y+1
-    if se_x < game.get_num_rows() and se_y < game.get_num_cols():
-        while game_board[se_y][se_x] == game.opposite_turn():
-            # print('South East')
-            south_east_list.append([se_y, se_x])
-            se_x += 1; se_y += 1
-            if se_x >= game.get_num_rows() or se_y >= game.get_num_cols():
-                south_east_list = []
-                break
-
-    # North East
-    ne_x = x+1; ne_y = y-1
-    if ne_x < game.get_num_rows() and ne_y >= 0:
-        while game_board[ne_y][ne_x] == game.opposite_turn():
-            # print('North East')
-            north_east_list.append([ne_y, ne_x])
-            ne_x += 1; ne_y -= 1
-            if ne_x >= game.get_num_rows() or ne_y < 0:
-                north_east_list = []
-                break
+def _flip_horizontal_vertical(game: othello, location: list, value: bool) -> bool:
+    '''Scans the horizontal and vertical directions for pieces to flip'''
+    return _flip_directions(game, location, value, slice(0, 4))
 
-    # South West
-    sw_x = x-1; sw_y = y+1
-    if sw_x >= 0 and sw_y < game.get_num_cols():
-        while game_board[sw_y][sw_x] == game.opposite_turn():
-            # print('South West')
-            south_west_list.append([sw_y, sw_x])
-            sw_x -= 1; sw_y += 1
-            if sw_x < 0 or sw_y >= game.get_num_cols():
-                south_west_list = []
-                break
-            
-    # Only add the list if the next piece in the direction is the same            
-    if len(north_west_list) != 0 and nw_x >= 0 and nw_y >= 0:
-        if game_board[nw_y][nw_x] == game.current_turn():
-            flip_list.extend(north_west_list)
-    if len(south_east_list) != 0 and se_x < game.get_num_rows() and se_y < game.get_num_cols():
-        if game_board[se_y][se_x] == game.current_turn():
-            flip_list.extend(south_east_list)
-    if len(north_east_list) != 0 and ne_x < game.get_num_rows() and ne_y >= 0:
-        if game_board[ne_y][ne_x] == game.current_turn():
-            flip_list.extend(north_east_list)
-    if len(south_west_list) != 0 and sw_x >= 0 and sw_y < game.get_num_cols():
-        if game_board[sw_y][sw_x] == game.current_turn():
-            flip_list.extend(south_west_list)
-
-    #print(flip_list)
-
-    # If value is True, set the board and flip the pieces
-    if len(flip_list) != 0 and value:
-        game.set_board([y, x], game.current_turn())
-        _flip_pieces(game, flip_list, game.current_turn())
-        return True
-    # If the value is False, just check if there are pieces to be flipped
+def _flip_diagonal(game: othello, location: list, value: bool) -> bool:
+    '''Scans the diagonal directions for pieces to flip'''
+    return _flip_directions(game, location, value, slice(4, 8))
+
+def _flip_directions(game: othello, location: list, value: bool, directions: slice) -> bool:
+    '''Check if a disk at the empty location flips pieces along the
+    directions picked by the slice, and if value is True, set the board and
+    flip them. Kept for the old per-square callers; legal_moves is the fast
+    way to find every move. A check looks up the square in the move mask of
+    the directions, which is filled once until the board changes'''
+    bit = game.get_square_bit(location[0], location[1])
     if not value:
-        if len(flip_list) == 0:
-            return False
-        else:
-            return True
-    return False
- 
-def _flip_pieces(game: othello, locations: list, turn: str) -> list:
-    '''Flip all the pieces that are specified in the location list'''
-    for disk in locations:
-        game.set_board(disk, turn)
-
-                                      
+        mask = game.get_cached_move_mask(directions.start)
+        if mask is None:
+            own, opp = game.get_player_masks()
+            mask = _fill_moves(own, opp, game.get_full_mask(),
+                               game.get_directions()[directions])
+            game.set_cached_move_mask(directions.start, mask)
+        return mask & bit != 0
+
+    own, opp = game.get_player_masks()
+    if (own | opp) & bit:
+        return False
+    flips = _fill_flips(own, opp, bit, game.get_directions()[directions])
+
+    # Set the board and flip the pieces
+    if flips:
+        game.place_disk(bit, flips)
+    return flips != 0
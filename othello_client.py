@@ -0,0 +1,120 @@
+# othello_client.py
+# Siddhartha Desai
+
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import othello_server
+
+
+#
+# Load generator
+#
+# Each session opens a connection, creates a game against the server's
+# engine and answers with random legal moves until the game is over. The
+# latency of a move is the time from sending it to reading the response,
+# which includes the engine's reply.
+async def _request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                   request: dict) -> dict:
+    '''Send one request and return its response'''
+    writer.write((json.dumps(request) + '\n').encode())
+    await writer.drain()
+    response = json.loads(await reader.readline())
+    if not response['ok']:
+        raise RuntimeError(response['error'])
+    return response
+
+
+async def play_session(host: str, port: int, settings: dict, generator: random.Random,
+                       latencies: list) -> None:
+    '''Play one game against the server, adding each move's seconds to
+    latencies'''
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        state = await _request(reader, writer, dict(settings, op = 'create'))
+        while state['status'] != 'finished':
+            row, col = generator.choice(state['moves'])
+            start = time.perf_counter()
+            state = await _request(reader, writer, {'op': 'move', 'session': state['session'],
+                                                    'row': row, 'col': col})
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_load(host: str, port: int, sessions: int, concurrency: int,
+                   settings: dict, seed: int = 0) -> dict:
+    '''Play sessions games with at most concurrency at once and return the
+    latency and throughput figures'''
+    latencies = []
+    remaining = iter(range(sessions))
+
+    async def worker() -> None:
+        for number in remaining:
+            await play_session(host, port, settings, random.Random(seed + number), latencies)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for i in range(min(concurrency, sessions))))
+    seconds = time.perf_counter() - start
+    return summarize(latencies, sessions, seconds)
+
+
+def summarize(latencies: list, sessions: int, seconds: float) -> dict:
+    '''Return the p50/p99 move latency in milliseconds and the sessions
+    finished per second, overall and per core'''
+    ordered = sorted(latencies)
+    cores = os.cpu_count()
+    return {'sessions': sessions, 'moves': len(ordered), 'seconds': round(seconds, 3),
+            'p50_ms': round(_percentile(ordered, 0.50) * 1000, 2),
+            'p99_ms': round(_percentile(ordered, 0.99) * 1000, 2),
+            'sessions_per_second': round(sessions / seconds, 3),
+            'cores': cores,
+            'sessions_per_core': round(sessions / seconds / cores, 3)}
+
+
+def _percentile(ordered: list, fraction: float) -> float:
+    '''Return the nearest-rank percentile of sorted values'''
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main(arguments: list = None) -> None:
+    '''Run the load generator from the command line'''
+    parser = argparse.ArgumentParser(description = 'Load test an Othello server.')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = othello_server.DEFAULT_PORT)
+    parser.add_argument('--local', action = 'store_true',
+                        help = 'start a server in this process instead of connecting to one')
+    parser.add_argument('--workers', type = int, default = os.cpu_count(),
+                        help = 'engine processes of the local server')
+    parser.add_argument('--sessions', type = int, default = 100)
+    parser.add_argument('--concurrency', type = int, default = 20)
+    parser.add_argument('--size', type = int, default = 8, help = 'rows and columns')
+    parser.add_argument('--time-limit', type = float, default = 0.01,
+                        help = 'engine seconds per move')
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args(arguments)
+    settings = {'rows': args.size, 'cols': args.size, 'computer': 'W',
+                'time_limit': args.time_limit}
+
+    async def load() -> dict:
+        if not args.local:
+            return await run_load(args.host, args.port, args.sessions, args.concurrency,
+                                  settings, args.seed)
+        server = othello_server.OthelloServer(args.workers)
+        await server.start(args.host, 0)
+        try:
+            return await run_load(args.host, server.get_port(), args.sessions,
+                                  args.concurrency, settings, args.seed)
+        finally:
+            await server.close()
+
+    print(json.dumps(asyncio.run(load())))
+
+
+if __name__ == '__main__':
+    main()
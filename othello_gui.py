@@ -1,28 +1,46 @@
 # othello_gui.py
 # Siddhartha Desai
 
+import queue
+import threading
 import othello
-import disk
+import search
+import endgame
+import ponder
 import tkinter
 from tkinter.messagebox import showinfo
 
-class OthelloGameOver(Exception):
-    '''Raised if the game is over'''
-    pass
+# Seconds the computer searches per move
+COMPUTER_TIME_LIMIT = 1.0
+
+# Milliseconds between checks for the computer's move
+POLL_INTERVAL = 50
 
 class OthelloGUI:
     '''Othello GUI class'''
     ### Othello GUI Constructor
     def __init__(self):
         # Initialize variables
-        self._state = []
         self._rows = None
         self._cols = None
         self._color = None
         self._top_left = None
         self._mode = None
+        self._computer = None
         self._button_pressed = False
 
+        # Computer opponent: its engine, which ponders on the player's time,
+        # the thread of its running search, the queue its moves come back on
+        # and the id of the search whose move is awaited. Moves of any other
+        # search are thrown away.
+        self._engine = None
+        self._ponderer = None
+        self._worker = None
+        self._moves = queue.Queue()
+        self._search_id = 0
+        self._thinking = False
+        self._game_over = False
+
         # Create main window
         self._main_window = tkinter.Tk()
         #self._main_window.wm_minsize(width=230, height=400)
@@ -33,11 +51,13 @@ class OthelloGUI:
         self._color_choice = tkinter.StringVar()
         self._top_left_choice = tkinter.StringVar()
         self._mode_choice = tkinter.StringVar()
+        self._computer_choice = tkinter.StringVar(value = 'Nobody')
 
         # Create user choices
         dimensions = ('4', '6', '8', '10', '12', '14', '16')
         colors = ('Black', 'White')
         modes = ('High', 'Low')
+        computers = ('Nobody', 'Black', 'White')
 
         # Create option widgets
         self._othello_text = tkinter.Label(self._main_window, text = 'OTHELLO', font = ('Helvetica', 30))
@@ -46,12 +66,14 @@ class OthelloGUI:
         self._color_text = tkinter.Label(self._main_window, text = 'Black or white:')
         self._top_left_text = tkinter.Label(self._main_window, text = 'Top left color:')
         self._mode_text = tkinter.Label(self._main_window, text = 'High or Low Mode:')
+        self._computer_text = tkinter.Label(self._main_window, text = 'Computer plays:')
 
         self._row_menu = tkinter.OptionMenu(self._main_window, self._row_choice, *dimensions, command = self._set_row)
         self._col_menu = tkinter.OptionMenu(self._main_window, self._col_choice, *dimensions, command = self._set_col)
         self._color_menu = tkinter.OptionMenu(self._main_window, self._color_choice, *colors, command = self._set_color)
         self._top_left_menu = tkinter.OptionMenu(self._main_window, self._top_left_choice, *colors, command = self._set_top_left)
         self._mode_menu = tkinter.OptionMenu(self._main_window, self._mode_choice, *modes, command = self._set_mode)
+        self._computer_menu = tkinter.OptionMenu(self._main_window, self._computer_choice, *computers, command = self._set_computer)
 
         self._play_button = tkinter.Button(self._main_window, text = 'Play Game', command = self._set_button)
 
@@ -62,13 +84,15 @@ class OthelloGUI:
         self._color_text.grid(row = 3, column = 0, padx = 10, pady = 10, sticky = tkinter.W)
         self._top_left_text.grid(row = 4, column = 0, padx = 10, pady = 10, sticky = tkinter.W)
         self._mode_text.grid(row = 5, column = 0, padx = 10, pady = 10, sticky = tkinter.W)
+        self._computer_text.grid(row = 6, column = 0, padx = 10, pady = 10, sticky = tkinter.W)
 
         self._row_menu.grid(row = 1, column = 1, padx = 10, pady = 10, sticky = tkinter.E)
         self._col_menu.grid(row = 2, column = 1, padx = 10, pady = 10, sticky = tkinter.E) 
         self._color_menu.grid(row = 3, column = 1, padx = 10, pady = 10, sticky = tkinter.E)
         self._top_left_menu.grid(row = 4, column = 1, padx = 10, pady = 10, sticky = tkinter.E)
         self._mode_menu.grid(row = 5, column = 1, padx = 10, pady = 10, sticky = tkinter.E)
-        self._play_button.grid(row = 6, columnspan = 2, padx = 10, pady = 10)
+        self._computer_menu.grid(row = 6, column = 1, padx = 10, pady = 10, sticky = tkinter.E)
+        self._play_button.grid(row = 7, columnspan = 2, padx = 10, pady = 10)
 
         # Set up grid configurations
         self._main_window.rowconfigure(0, weight = 1)
@@ -114,6 +138,11 @@ class OthelloGUI:
         self._create_game()
         # print(self._mode)
         
+    def _set_computer(self, event: tkinter.Event) -> None:
+        '''Set the computer's color, or None for a two player game'''
+        self._computer = {'Black': 'B', 'White': 'W'}.get(self._computer_choice.get())
+        self._create_game()
+
     def _set_button(self) -> None:
         '''Set button pressed equal to true to allow for continuation'''
         self._button_pressed = True
@@ -129,7 +158,13 @@ class OthelloGUI:
         '''Delete the previous widgets, and call the game widget making functions
         if button has been pressed. If not, then reset back to False'''
         if ((self._rows and self._cols and self._color and self._top_left and self._mode) != None) and self._button_pressed:
-            self._game = othello.othello(self._rows, self._cols, self._color, self._top_left)
+            self._game = othello.othello(self._rows, self._cols, self._color, self._top_left, self._mode)
+
+            # Drop any search still running for a previous game
+            self._cancel_search()
+            self._engine = search.SearchEngine(endgame_solver = endgame.EndgameSolver(10))
+            self._ponderer = ponder.Ponderer(self._engine)
+            self._game_over = False
 
             # Delete option window widgets
             self._othello_text.grid_remove()
@@ -143,24 +178,32 @@ class OthelloGUI:
             self._color_menu.grid_remove()
             self._top_left_menu.grid_remove()
             self._mode_menu.grid_remove()
+            self._computer_text.grid_remove()
+            self._computer_menu.grid_remove()
             self._play_button.grid_remove()
 
-            # Create the canvas and update the disk state'''
+            # Create the canvas and the labels, then show the starting disks
             self._create_canvas()
-            self._create_state()
+            self._create_labels()
+            self._update_board()
+            self._start_search()
         else:
             self._button_pressed = False
 
     def _create_canvas(self):
-        '''Create the tkinter canvas on the main window'''
+        '''Create the tkinter canvas on the main window, with the grid lines
+        and one hidden disk per square. The items are created once and only
+        moved or recolored afterwards'''
         if self._rows > self._cols:
             span = 650 / self._rows
         else:
             span = 650 / self._cols
+        self._canvas_width = self._cols * span
+        self._canvas_height = self._rows * span
             
         self._canvas = tkinter.Canvas(
             master = self._main_window,
-            width = self._cols * span, height = self._rows * span,
+            width = self._canvas_width, height = self._canvas_height,
             background = '#FFDAB9')
 
         self._canvas.grid(
@@ -169,170 +212,205 @@ class OthelloGUI:
         
         self._canvas.bind('<Configure>', self._canvas_resized)
         self._canvas.bind('<Button-1>', self._mouse_click)            
-        
-        #force = tkinter.Event()
-        #self._canvas_resized(force)'''
-
-    def _create_state(self):
-        '''Go through the board and create a Disk object for each piece'''
-        self._state = []
-        board = self._game.get_board()
 
-        # Calculate pixel lengths
-        delta_x = self._canvas.winfo_width() / self._cols
-        delta_y = self._canvas.winfo_height() / self._rows
-        half_delta_x = delta_x - (delta_x / 2)
-        half_delta_y = delta_y - (delta_y / 2)
-
-        # Create a Disk object for each piece in the board and append to list
-        for row in range(self._rows):
-            for col in range(self._cols):
-                if board[col][row] != []:
-                    px = (delta_x * col) + half_delta_x
-                    py = (delta_y * row) + half_delta_y
-                    rx = half_delta_x * 0.75
-                    ry = half_delta_y * 0.75
-                    self._state.append(self._produce_disk(px, py, rx, ry, board[col][row]))
-
-        self._redraw_disks()
-
-        # Create labels for keeping track of score and turn
-        self._white_score_label = tkinter.StringVar()
-        self._black_score_label = tkinter.StringVar()
-        self._player_turn_label = tkinter.StringVar()
-        self._white_score_label = tkinter.Label(self._main_window, text = 'White: {}'.format(self._game.get_white_score()), font = ('Helvetica', 16))
-        self._black_score_label = tkinter.Label(self._main_window, text = 'Black: {}'.format(self._game.get_black_score()), font = ('Helvetica', 16))
-        self._player_turn_label = tkinter.Label(self._main_window, text = 'Turn: {}'.format(self._game.current_turn()), font = ('Helvetica', 16))
+        # Column lines first, then row lines, and the disks square by square
+        self._lines = [self._canvas.create_line(0, 0, 0, 0, fill = 'black')
+                       for line in range(self._cols + self._rows)]
+        self._disks = [self._canvas.create_oval(0, 0, 0, 0, state = tkinter.HIDDEN)
+                       for square in range(self._rows * self._cols)]
+
+        # Bitboards of the disks the canvas shows
+        self._shown_white = 0
+        self._shown_black = 0
+        self._place_items()
+
+    def _create_labels(self):
+        '''Create the labels that keep track of the score and the turn'''
+        self._white_score_label = tkinter.Label(self._main_window, font = ('Helvetica', 16))
+        self._black_score_label = tkinter.Label(self._main_window, font = ('Helvetica', 16))
+        self._player_turn_label = tkinter.Label(self._main_window, font = ('Helvetica', 16))
         self._player_turn_label.grid(row = 1, columnspan = 3, padx = 10, pady = 10, sticky = tkinter.N + tkinter.S + tkinter.W + tkinter.E)
         self._white_score_label.grid(row = 2, column = 0, padx = 10, pady = 5, sticky = tkinter.W)
         self._black_score_label.grid(row = 2, column = 2, padx = 10, pady = 5, sticky = tkinter.E)
-        
-    def _produce_disk(self, px: float, py: float, rx: float, ry: float, color: str) -> disk.Disk:
-        '''Given inputs, return a Disk object'''
-        canvas_x = self._canvas.winfo_width()
-        canvas_y = self._canvas.winfo_height()
-    
-        return disk.Disk((px/canvas_x, py/canvas_y), (rx/canvas_x, ry/canvas_y), color)
+
+    def _update_board(self):
+        '''Recolor the squares that changed since the last update and refresh
+        the labels'''
+        white = self._game.get_white_mask()
+        black = self._game.get_black_mask()
+        stride = self._game.get_stride()
+        changed = (white ^ self._shown_white) | (black ^ self._shown_black)
+        while changed:
+            bit = changed & -changed
+            changed ^= bit
+            row, col = divmod(bit.bit_length() - 1, stride)
+            item = self._disks[row * self._cols + col]
+            if white & bit:
+                self._canvas.itemconfig(item, fill = 'white', outline = 'black', state = tkinter.NORMAL)
+            elif black & bit:
+                self._canvas.itemconfig(item, fill = 'black', outline = 'white', state = tkinter.NORMAL)
+            else:
+                self._canvas.itemconfig(item, state = tkinter.HIDDEN)
+        self._shown_white = white
+        self._shown_black = black
+
+        self._white_score_label.config(text = 'White: {}'.format(self._game.get_white_score()))
+        self._black_score_label.config(text = 'Black: {}'.format(self._game.get_black_score()))
+        if self._thinking:
+            self._player_turn_label.config(text = 'Turn: {} (thinking...)'.format(self._game.current_turn()))
+        else:
+            self._player_turn_label.config(text = 'Turn: {}'.format(self._game.current_turn()))
         
 
     ### Event Handlers
     def _canvas_resized(self, event: tkinter.Event) -> None:
-        '''When the canvas is resized, delete all widgets and redraw them'''
-        self._canvas.delete(tkinter.ALL)
-        
-        self._draw_grid()
-        self._redraw_disks()
+        '''When the canvas is resized, move the existing items to fit it'''
+        self._canvas_width = event.width
+        self._canvas_height = event.height
+        self._place_items()
 
     def _mouse_click(self, event: tkinter.Event) -> None:
         '''When the mouse is clicked, convert pixels into row and column. Then
-        run the game flow method'''
-        canvas_x = self._canvas.winfo_width()
-        canvas_y = self._canvas.winfo_height()
+        run the game flow method. Clicks are ignored while it is the
+        computer's turn'''
+        if self._game_over or self._thinking or self._game.current_turn() == self._computer:
+            return
+        canvas_x = self._canvas_width
+        canvas_y = self._canvas_height
         
         # print(event.x, event.y)
         row = int(event.y // (canvas_y / self._rows))
         col = int(event.x // (canvas_x / self._cols))
         # print(row)
         # print(col)
-            
+        self._play_move(row, col)
+
+    def _play_move(self, row: int, col: int) -> None:
+        '''Play a move through the game flow and show the result. Then start
+        the computer's search if it is the computer's turn'''
         is_winner = self._game_flow(row, col)
         # othello_ui._display_board(self._game)
+        self._update_board()
         if is_winner:
-            self._create_state()
-            self._redraw_disks()
+            self._game_over = True
             self._display_winner()
             return
+        self._start_search()
 
-        self._create_state()
-        self._redraw_disks()
+
+    ### Computer Opponent Methods
+    def _start_search(self) -> None:
+        '''If it is the computer's turn, search a copy of the game on a
+        background thread and poll for its move. If it is the player's turn
+        against the computer, ponder instead'''
+        if self._game_over or self._computer is None:
+            return
+        if self._game.current_turn() != self._computer:
+            self._ponderer.start(self._game)
+            return
+        self._search_id += 1
+        self._worker = threading.Thread(target = _search_worker,
+                                        args = (self._ponderer, self._game.clone(), self._search_id, self._moves),
+                                        daemon = True)
+        self._thinking = True
+        self._canvas.config(cursor = 'watch')
+        self._update_board()
+        self._worker.start()
+        self._main_window.after(POLL_INTERVAL, self._poll_search)
+
+    def _poll_search(self) -> None:
+        '''Play the computer's move if it has arrived, or check again later'''
+        while True:
+            try:
+                search_id, move = self._moves.get_nowait()
+            except queue.Empty:
+                if self._thinking:
+                    self._main_window.after(POLL_INTERVAL, self._poll_search)
+                return
+            if search_id == self._search_id:
+                break
+
+        self._thinking = False
+        self._canvas.config(cursor = '')
+        if move is None:
+            self._update_board()
+            return
+        self._play_move(move[0], move[1])
+
+    def _cancel_search(self) -> None:
+        '''Stop the running search or pondering, if any, and forget its move'''
+        self._search_id += 1
+        if self._thinking:
+            # The worker may not have entered the search yet, which would
+            # clear a single stop, so stop until the thread is done
+            while self._worker.is_alive():
+                self._engine.stop()
+                self._worker.join(ponder.STOP_INTERVAL)
+        elif self._ponderer is not None:
+            self._ponderer.stop()
+        self._worker = None
+        self._thinking = False
 
 
     ### Drawing Methods
     
     
-    def _draw_grid(self) -> None:
-        '''Draw grid lines'''
-        delta_x = self._canvas.winfo_width() / self._cols
-        delta_y = self._canvas.winfo_height() / self._rows
+    def _place_items(self) -> None:
+        '''Move the grid lines and the disks to the current canvas size'''
+        delta_x = self._canvas_width / self._cols
+        delta_y = self._canvas_height / self._rows
         for i in range(self._cols):
-            self._canvas.create_line(delta_x*i, 0, delta_x*i, self._canvas.winfo_height(), fill = 'black')
+            self._canvas.coords(self._lines[i], delta_x*i, 0, delta_x*i, self._canvas_height)
         for j in range(self._rows):
-            self._canvas.create_line(0, delta_y*j, self._canvas.winfo_width(), delta_y*j, fill = 'black')            
+            self._canvas.coords(self._lines[self._cols + j], 0, delta_y*j, self._canvas_width, delta_y*j)
 
-    def _redraw_disks(self) -> None:
-        '''Draw disks from the list of Disk objects'''
-        canvas_px = self._canvas.winfo_width()
-        canvas_py = self._canvas.winfo_height()
-        
-        for disk in self._state:
-            center_x = canvas_px * disk.center()[0] 
-            center_y = canvas_py * disk.center()[1]
-            radius_x = canvas_px * disk.radius()[0]
-            radius_y = canvas_py * disk.radius()[1]
-            
-            self._canvas.create_oval(
-                center_x - radius_x,
-                center_y - radius_y,
-                center_x + radius_x,
-                center_y + radius_y,
-                fill = disk.color(), outline = disk.opposite_color())
+        radius_x = delta_x / 2 * 0.75
+        radius_y = delta_y / 2 * 0.75
+        for row in range(self._rows):
+            for col in range(self._cols):
+                center_x = (delta_x * col) + delta_x / 2
+                center_y = (delta_y * row) + delta_y / 2
+                self._canvas.coords(self._disks[row * self._cols + col],
+                                    center_x - radius_x, center_y - radius_y,
+                                    center_x + radius_x, center_y + radius_y)
 
     def _display_winner(self) -> None:
         '''Display a pop up window when someone wins'''
-        winner_str = 'Player {} wins!\n\nWhite score: {}\nBlack score: {}'.format(self._winner, self._game.get_white_score(), self._game.get_black_score())
+        if self._winner == 'WB':
+            result = 'No winner.'
+        else:
+            result = 'Player {} wins!'.format(self._winner)
+        winner_str = '{}\n\nWhite score: {}\nBlack score: {}'.format(result, self._game.get_white_score(), self._game.get_black_score())
         showinfo(message = winner_str)
 
 
     ### Main Gameplay Methods
     def _game_flow(self, row: int, col: int) -> bool:
-        '''Incorporating the game play logic into GUI'''
-        try:
-            # If the board is full, determine the winner
-            self._winner = othello.winning_player(self._game, othello.is_board_full(self._game), self._mode)
-            if ('W' or 'B' or 'WB') == self._winner:
-                return True
-
-            # If there is no available moves, then raise exception
-            if not othello._any_available_moves(self._game):
-                raise othello.OthelloNoValidMoves()
-            
+        '''Incorporating the game play logic into GUI. Play the move if it is
+        legal, and pass for the next player if they cannot move. Returns True
+        once the game is over'''
+        status, self._winner = othello.game_status(self._game)
+        if status == othello.ONGOING:
+            # Clicks on squares that are not legal moves are ignored
+            if (row, col) not in othello.legal_moves(self._game):
+                return False
             othello.make_a_move(self._game, [row, col])
-            self._redraw_disks()
             self._game.change_player()
-            self._create_state()
+            status, self._winner = othello.game_status(self._game)
 
-            self._winner = othello.winning_player(self._game, othello.is_board_full(self._game), self._mode)
-            if ('W' or 'B' or 'WB') == self._winner:
-                return True
+        if status == othello.MUST_PASS:
+            # print('Player {} has no available moves.'.format(self._game.current_turn()))
+            self._game.change_player()
+            status, self._winner = othello.game_status(self._game)
 
-            if not othello._any_available_moves(self._game):
-                raise othello.OthelloNoValidMoves()
-        
-        except othello.OthelloNotEmptyError:
-            pass
+        return status == othello.FINISHED
 
-        except othello.OthelloNoValidMoves:
-            self._game.change_player()
-            self._create_state()
-            try:
-                if not othello._any_available_moves(self._game):
-                    # If there is no available moves again, then raise exception
-                    # print('Player {} has no available moves.'.format(self._game.current_turn()))
-                    raise OthelloGameOver()
-                # print('Player {} has no available moves.'.format(self._game.opposite_turn()))
-                # print("Player {}'s turn again.".format(self._game.current_turn()))
-                
-            except OthelloGameOver:
-                # Game is over
-                # print('Player {} has no available moves.'.format(self._game.opposite_turn()))
-                self._winner = othello.winning_player(self._game, True, self._mode)
-                return True
-
-        self._winner = othello.winning_player(self._game, othello.is_board_full(self._game), self._mode)
-        if ('W' or 'B' or 'WB') == self._winner:
-                return True
-            
-        return False
+
+def _search_worker(ponderer: ponder.Ponderer, game: othello.othello, search_id: int,
+                   moves: queue.Queue) -> None:
+    '''Search the game and put (search id, move) on the queue. Runs on a
+    background thread, so it must not touch any tkinter widget'''
+    moves.put((search_id, ponderer.choose_move(game, COMPUTER_TIME_LIMIT)))
 
 
 if __name__ == '__main__':
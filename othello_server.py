@@ -0,0 +1,369 @@
+# othello_server.py
+# Siddhartha Desai
+
+import os
+import sys
+import json
+import time
+import asyncio
+import secrets
+import argparse
+import multiprocessing
+import concurrent.futures
+import othello
+import search
+import endgame
+
+DEFAULT_PORT = 7654
+
+# Seconds without a request after which a session is dropped
+IDLE_TIMEOUT = 300.0
+
+# Most sessions held at once
+MAX_SESSIONS = 10000
+
+# Longest request line in bytes
+MAX_LINE = 4096
+
+# Default and largest seconds the engine searches per move
+DEFAULT_TIME_LIMIT = 0.1
+MAX_TIME_LIMIT = 5.0
+
+
+class OthelloRequestError(Exception):
+    '''Raised if a request cannot be carried out'''
+    pass
+
+
+#
+# Engine worker functions
+#
+_worker_engine = None
+
+def _engine_move(state: bytes, time_limit: float) -> tuple:
+    '''Return the engine's move for a compact game state. Runs in a worker
+    process, which keeps one engine and its transposition table'''
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = search.SearchEngine(endgame_solver = endgame.EndgameSolver(10))
+    return _worker_engine.search(othello.othello.from_bytes(state), time_limit = time_limit)
+
+
+#
+# Session class
+#
+class Session:
+    '''One game hosted by the server, optionally against the engine'''
+    def __init__(self, game: othello.othello, computer: str, time_limit: float):
+        self._game = game
+        self._computer = computer
+        self._time_limit = time_limit
+        self._lock = asyncio.Lock()
+        self._last_active = time.monotonic()
+        self._resigned = None
+
+    def touch(self) -> None:
+        '''Mark the session as used now'''
+        self._last_active = time.monotonic()
+
+    def resign(self, player: str) -> None:
+        '''Let a player give up the game'''
+        self._resigned = player
+
+    def get_game(self) -> othello.othello:
+        '''Return the game'''
+        return self._game
+
+    def get_computer(self) -> str:
+        '''Return the engine's color, or None if people play both colors'''
+        return self._computer
+
+    def get_time_limit(self) -> float:
+        '''Return the engine's seconds per move'''
+        return self._time_limit
+
+    def get_lock(self) -> asyncio.Lock:
+        '''Return the lock that keeps the requests of the session in order'''
+        return self._lock
+
+    def get_last_active(self) -> float:
+        '''Return the time.monotonic() of the last request'''
+        return self._last_active
+
+    def get_resigned(self) -> str:
+        '''Return the color that resigned, or None'''
+        return self._resigned
+
+    def state(self) -> dict:
+        '''Return the game as a JSON-ready dict. Board rows are strings of
+        'W', 'B' and '.'; moves are [row, col] pairs counted from 0'''
+        game = self._game
+        status, winner = othello.game_status(game)
+        if self._resigned is not None:
+            status = othello.FINISHED
+            winner = 'B' if self._resigned == 'W' else 'W'
+        white = game.get_white_mask()
+        black = game.get_black_mask()
+        board = []
+        for row in range(game.get_num_rows()):
+            squares = []
+            for col in range(game.get_num_cols()):
+                bit = game.get_square_bit(row, col)
+                squares.append('W' if white & bit else 'B' if black & bit else '.')
+            board.append(''.join(squares))
+        moves = [] if status == othello.FINISHED else sorted(othello.legal_moves(game))
+        return {'board': board, 'turn': game.current_turn(), 'status': status,
+                'winner': winner, 'white': game.get_white_score(),
+                'black': game.get_black_score(), 'moves': [list(move) for move in moves]}
+
+
+#
+# Server class
+#
+class OthelloServer:
+    '''Hosts many games in one process. Requests and responses are JSON
+    objects, one per line. Each connection is served one request at a time
+    and a response must drain before the next request is read, so a client
+    that does not read is slowed down rather than buffered. Engine searches
+    run in a process pool so the event loop never blocks on them'''
+    def __init__(self, workers: int = None, idle_timeout: float = IDLE_TIMEOUT,
+                 max_sessions: int = MAX_SESSIONS):
+        self._workers = workers
+        self._executor = self._new_executor()
+        self._idle_timeout = idle_timeout
+        self._max_sessions = max_sessions
+        self._sessions = {}
+        self._server = None
+        self._sweeper = None
+        self._connections = {}
+        self._requests = 0
+        self._evicted = 0
+
+    def _new_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        '''Return a pool of engine processes'''
+        # Forked workers would inherit the client sockets open at the time and
+        # keep those connections from closing, so they are spawned instead
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers = self._workers, mp_context = multiprocessing.get_context('spawn'))
+
+    ### Serving methods
+    async def start(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT) -> None:
+        '''Start listening and evicting idle sessions'''
+        self._server = await asyncio.start_server(self._serve_connection, host, port,
+                                                  limit = MAX_LINE)
+        self._sweeper = asyncio.ensure_future(self._evict_idle())
+
+    async def serve_forever(self) -> None:
+        '''Serve until cancelled'''
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        '''Stop listening and shut down the engine processes'''
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # Closing a connection ends its handler at the next read
+        for writer in list(self._connections.values()):
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions = True)
+        self._executor.shutdown(cancel_futures = True)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> None:
+        '''Answer the requests of one connection in order'''
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(_encode({'ok': False, 'error': 'Request line too long'}))
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                writer.write(_encode(await self.handle_line(line)))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self._connections[asyncio.current_task()]
+            writer.close()
+
+    async def _evict_idle(self) -> None:
+        '''Drop the sessions that have been idle for too long'''
+        while True:
+            await asyncio.sleep(max(1.0, self._idle_timeout / 4))
+            cutoff = time.monotonic() - self._idle_timeout
+            for session_id, session in list(self._sessions.items()):
+                if session.get_last_active() < cutoff and not session.get_lock().locked():
+                    del self._sessions[session_id]
+                    self._evicted += 1
+
+    ### Request methods
+    async def handle_line(self, line: bytes) -> dict:
+        '''Return the response to one request line'''
+        self._requests += 1
+        try:
+            request = json.loads(line)
+        except (ValueError, RecursionError):
+            # ValueError covers bad JSON and bytes that are not UTF-8
+            return {'ok': False, 'error': 'Request is not valid JSON'}
+
+        request_id = None
+        try:
+            if not isinstance(request, dict):
+                raise OthelloRequestError('Request must be a JSON object')
+            request_id = request.get('id')
+            response = await self.handle_request(request)
+        except (OthelloRequestError, othello.OthelloDimensionError) as error:
+            response = {'ok': False, 'error': str(error) or type(error).__name__}
+        if request_id is not None:
+            response['id'] = request_id
+        return response
+
+    async def handle_request(self, request: dict) -> dict:
+        '''Carry out a create, move, state or resign request'''
+        op = request.get('op')
+        if op == 'create':
+            return await self._create(request)
+        if op == 'stats':
+            return {'ok': True, 'sessions': len(self._sessions),
+                    'requests': self._requests, 'evicted': self._evicted}
+
+        session_id = request.get('session')
+        session = self._sessions.get(session_id) if isinstance(session_id, str) else None
+        if session is None:
+            raise OthelloRequestError('Unknown session')
+        session.touch()
+        async with session.get_lock():
+            if op == 'move':
+                await self._move(session, request)
+            elif op == 'resign':
+                player = request.get('player') or session.get_game().current_turn()
+                if player not in ('W', 'B'):
+                    raise OthelloRequestError('player must be W or B')
+                session.resign(player)
+                del self._sessions[session_id]
+            elif op == 'state':
+                await self._advance(session)
+            else:
+                raise OthelloRequestError('Unknown op: {}'.format(op))
+            return dict(session.state(), ok = True, session = session_id)
+
+    async def _create(self, request: dict) -> dict:
+        '''Start a session and play the engine's first moves if it is to
+        move'''
+        if len(self._sessions) >= self._max_sessions:
+            raise OthelloRequestError('Too many sessions')
+        rows = request.get('rows', 8)
+        cols = request.get('cols', 8)
+        turn = request.get('turn', 'B')
+        top_left = request.get('top_left', 'W')
+        mode = request.get('mode', 'high')
+        computer = request.get('computer')
+        if (type(rows) != int or type(cols) != int or rows % 2 or cols % 2 or
+            turn not in ('W', 'B') or
+            top_left not in ('W', 'B') or mode not in ('high', 'low') or
+            computer not in ('W', 'B', None)):
+            raise OthelloRequestError('Invalid game settings')
+        time_limit = request.get('time_limit', DEFAULT_TIME_LIMIT)
+        if (type(time_limit) not in (int, float) or
+            not 0 < time_limit <= MAX_TIME_LIMIT):
+            raise OthelloRequestError('time_limit must be between 0 and {}'.format(MAX_TIME_LIMIT))
+
+        session = Session(othello.othello(rows, cols, turn, top_left, mode), computer, time_limit)
+        session_id = secrets.token_hex(8)
+        self._sessions[session_id] = session
+        async with session.get_lock():
+            await self._advance(session)
+            return dict(session.state(), ok = True, session = session_id)
+
+    async def _move(self, session: Session, request: dict) -> None:
+        '''Play the requested move, then the engine's replies'''
+        row = request.get('row')
+        col = request.get('col')
+        if type(row) != int or type(col) != int:
+            raise OthelloRequestError('row and col must be integers')
+        # Finish engine moves that a failed request left unplayed
+        await self._advance(session)
+
+        game = session.get_game()
+        status, winner = othello.game_status(game)
+        if status != othello.ONGOING or game.current_turn() == session.get_computer():
+            raise OthelloRequestError('Not your turn')
+        if (row, col) not in othello.legal_moves(game):
+            raise OthelloRequestError('Illegal move')
+        othello.apply_move(game, (row, col))
+        await self._advance(session)
+
+    async def _advance(self, session: Session) -> None:
+        '''Pass for players who cannot move and play the engine's moves until
+        a person is to move or the game is over'''
+        game = session.get_game()
+        loop = asyncio.get_running_loop()
+        while True:
+            status, winner = othello.game_status(game)
+            if status == othello.MUST_PASS:
+                othello.apply_move(game, None)
+            elif status == othello.ONGOING and game.current_turn() == session.get_computer():
+                try:
+                    move = await loop.run_in_executor(self._executor, _engine_move,
+                                                      game.to_bytes(), session.get_time_limit())
+                except concurrent.futures.BrokenExecutor:
+                    self._executor = self._new_executor()
+                    raise OthelloRequestError('Engine failed, the move can be retried')
+                except Exception as error:
+                    raise OthelloRequestError('Engine failed: {}'.format(error))
+                othello.apply_move(game, move)
+            else:
+                return
+
+    ### Getter methods
+    def get_port(self) -> int:
+        '''Return the port the server listens on'''
+        return self._server.sockets[0].getsockname()[1]
+
+    def get_sessions(self) -> int:
+        '''Return the number of live sessions'''
+        return len(self._sessions)
+
+
+def _encode(response: dict) -> bytes:
+    '''Return a response as one JSON line'''
+    return (json.dumps(response, separators = (',', ':')) + '\n').encode()
+
+
+def main(arguments: list = None) -> None:
+    '''Run the server from the command line'''
+    parser = argparse.ArgumentParser(description = 'Serve Othello games over TCP.')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = DEFAULT_PORT)
+    parser.add_argument('--workers', type = int, default = os.cpu_count(),
+                        help = 'engine processes')
+    parser.add_argument('--idle-timeout', type = float, default = IDLE_TIMEOUT)
+    parser.add_argument('--max-sessions', type = int, default = MAX_SESSIONS)
+    args = parser.parse_args(arguments)
+
+    async def serve() -> None:
+        server = OthelloServer(args.workers, args.idle_timeout, args.max_sessions)
+        await server.start(args.host, args.port)
+        print('Serving on {}:{}'.format(args.host, args.port), file = sys.stderr)
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
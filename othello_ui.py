@@ -1,7 +1,16 @@
 # othello_ui.py
 # Siddhartha Desai
 
+import sys
+import argparse
 import othello
+import game_record
+import search
+import endgame
+import ponder
+
+# Seconds the computer searches per move
+COMPUTER_TIME_LIMIT = 1.0
 
 def user_interface():
     '''Interface that is presented to the user'''
@@ -17,31 +26,42 @@ def user_interface():
     print()
     # Ask user for game mode (highest wins / lowest wins)
     game_mode = _ask_game_mode()
+    print()
+    # Ask user which color, if any, the computer plays
+    computer = _ask_computer()
+
+    # The computer ponders while the user types in a move
+    ponderer = None
+    if computer is not None:
+        ponderer = ponder.Ponderer(search.SearchEngine(endgame_solver = endgame.EndgameSolver(10)))
 
     # Create othello game
-    game = othello.othello(board_dimensions[0], board_dimensions[1], color_choice, top_left)
+    game = othello.othello(board_dimensions[0], board_dimensions[1], color_choice, top_left, game_mode)
     # game = othello.othello(8, 8, 'B', 'B')
     
     _display_stats(game)
-    no_valid_moves = 0
 
     # Main loop that asks the players for moves
     while True:
-        try:
-            # If the board is full, determine the winner
-            winner = othello.winning_player(game, othello.is_board_full(game), game_mode)
-            if ('W' or 'B' or 'WB') == winner:
-                break
+        status, winner = othello.game_status(game)
+        if status == othello.FINISHED:
+            break
 
-            # If there is no available moves, then raise exception
-            if not othello._any_available_moves(game):
-                _display_board(game)
-                raise othello.OthelloNoValidMoves()
+        # If there is no available moves, the other player goes again
+        if status == othello.MUST_PASS:
+            _display_board(game)
+            game.change_player()
+            print('Player {} has no available moves.'.format(game.opposite_turn()))
+            print("Player {}'s turn again.".format(game.current_turn()))
+            continue
 
-            _ask_for_move(game)
+        try:
+            if game.current_turn() == computer:
+                _computer_move(game, ponderer)
+            else:
+                _ask_for_move(game, ponderer)
             game.change_player()
             _display_stats(game)
-            no_valid_moves = 0
 
         except othello.OthelloOutOfBoundsError:
             _display_stats(game)
@@ -51,18 +71,8 @@ def user_interface():
             _display_stats(game)
             print('Cannot place piece over an existing piece.')
 
-        except othello.OthelloNoValidMoves:
-            game.change_player()
-            no_valid_moves += 1
-            
-            # If both players are unable to move, break out of loop
-            if no_valid_moves == 2:
-                winner = othello.winning_player(game, True, game_mode)
-                break
-            
-            print('Player {} has no available moves.'.format(game.opposite_turn()))
-            print("Player {}'s turn again.".format(game.current_turn()))
-
+    if ponderer is not None:
+        ponderer.stop()
     print('Game Over')
    
     if winner == 'W' or winner == 'B':
@@ -171,8 +181,29 @@ def _ask_game_mode() -> str:
                 print("Invalid game mode\n")
 
 
-def _ask_for_move(game: othello) -> None:
-    '''Ask the user for a move'''
+def _ask_computer() -> str:
+    '''Ask the user which color the computer should play, if any'''
+    while True:
+        color = input('Should the computer play (black), (white) or (neither)? ')
+        if len(color) == 0:
+            print("No computer color given\n")
+        else:
+            color = color.strip().lower()
+            if color == 'black':
+                return 'B'
+            elif color == 'white':
+                return 'W'
+            elif color == 'neither':
+                return None
+            else:
+                print('Not a valid choice.\n')
+
+
+def _ask_for_move(game: othello, ponderer: ponder.Ponderer = None) -> None:
+    '''Ask the user for a move. If there is a computer opponent, it ponders
+    until the move is typed in'''
+    if ponderer is not None:
+        ponderer.start(game)
     while True:
         move = input("Please type in a move, example: 1, 2: ")
         if len(move) == 0:
@@ -193,6 +224,13 @@ def _ask_for_move(game: othello) -> None:
                 print('Did not type in a valid number.\n')
 
 
+def _computer_move(game: othello, ponderer: ponder.Ponderer) -> None:
+    '''Let the computer pick and make its move'''
+    move = ponderer.choose_move(game, COMPUTER_TIME_LIMIT)
+    print('Computer plays {}, {}'.format(move[0] + 1, move[1] + 1))
+    othello.make_a_move(game, list(move))
+
+
 def _display_stats(game: othello):
     '''Display the scores, board, and current turn''' 
     print()
@@ -218,5 +256,165 @@ def _display_turn(game: othello):
     game.print_turn()
 
 
+#
+# Scripted mode
+#
+# Games are replayed without prompts from moves written the way they are
+# typed in, or from game record files. Only what the verbosity asks for is
+# printed: 0 the result, 1 also the final board, 2 also a line per move and
+# 3 the board after every move, as in the interactive game.
+def parse_moves(lines):
+    '''Generate the moves in lines of text written the way they are typed in,
+    such as "1, 2", as (row, col) pairs counted from 0. Moves are given one
+    per line or separated by semicolons, "pass" gives None and text after a
+    "#" is ignored. Raises ValueError on anything else'''
+    for line in lines:
+        for move in line.split('#')[0].split(';'):
+            move = move.strip()
+            if len(move) == 0:
+                continue
+            if move.lower() == 'pass':
+                yield None
+                continue
+            move = move.split(',')
+            if len(move) != 2:
+                raise ValueError('Did not specify a row and column: {}'.format(','.join(move)))
+            yield (int(move[0].strip()) - 1, int(move[1].strip()) - 1)
+
+
+def play_script(game: othello, moves, verbosity: int = 1,
+                written_passes: bool = False) -> None:
+    '''Play moves, given as (row, col) pairs counted from 0 or None for a
+    pass, on the game. A player who cannot move passes without a move being
+    given, unless written_passes is set, in which case the pass must be
+    given. Passes after the end of the game are skipped. Raises
+    othello.OthelloInvalidMoveError on a move that is not legal'''
+    ply = 0
+    for move in moves:
+        status = othello.game_status(game)[0]
+        if move is None and status != othello.ONGOING:
+            if status == othello.MUST_PASS:
+                ply += 1
+                _play_scripted_move(game, ply, None, verbosity)
+            continue
+        if status == othello.MUST_PASS and not written_passes:
+            ply += 1
+            _play_scripted_move(game, ply, None, verbosity)
+        ply += 1
+        if move is not None:
+            move = tuple(move)
+        if move is None or move not in othello.legal_moves(game):
+            raise othello.OthelloInvalidMoveError(
+                'Move {} by player {} is not legal: {}'.format(
+                    ply, game.current_turn(),
+                    'pass' if move is None else '{}, {}'.format(move[0] + 1, move[1] + 1)))
+        _play_scripted_move(game, ply, move, verbosity)
+
+    # Passes after the last move
+    while othello.game_status(game)[0] == othello.MUST_PASS:
+        ply += 1
+        _play_scripted_move(game, ply, None, verbosity)
+
+
+def _play_scripted_move(game: othello, ply: int, move: tuple, verbosity: int) -> None:
+    '''Make a legal move, or a pass if move is None, and print it at the
+    verbosity'''
+    player = game.current_turn()
+    othello.apply_move(game, move)
+    if verbosity >= 3:
+        _display_stats(game)
+    elif verbosity == 2:
+        if move is None:
+            print('{}. {} passes'.format(ply, player))
+        else:
+            print('{}. {} plays {}, {}  Black: {}  White: {}'.format(
+                ply, player, move[0] + 1, move[1] + 1,
+                game.get_black_score(), game.get_white_score()))
+
+
+def replay_game(number: int, record: tuple, verbosity: int = 1,
+                written_passes: bool = False) -> bool:
+    '''Replay a (rows, cols, top left, turn, mode, moves) game and print its
+    result. Returns False if the game is not valid'''
+    rows, cols, top_left, turn, mode, moves = record
+    try:
+        game = othello.othello(rows, cols, turn, top_left, mode)
+        play_script(game, moves, verbosity, written_passes)
+    except (ValueError, othello.OthelloDimensionError,
+            othello.OthelloInvalidMoveError) as error:
+        print('Game {}: {}'.format(number, error))
+        return False
+
+    if verbosity >= 1:
+        _display_score(game)
+        _display_board(game)
+    status, winner = othello.game_status(game)
+    if status != othello.FINISHED:
+        result = 'Game not finished.'
+    elif winner == 'W' or winner == 'B':
+        result = 'Player {} wins!'.format(winner)
+    else:
+        result = 'No winner.'
+    print('Game {}: {}'.format(number, result))
+    return True
+
+
+def _color(choice: str) -> str:
+    '''Return 'B' or 'W' for a color choice of black or white'''
+    return 'B' if choice == 'black' else 'W'
+
+
+def main(arguments: list = None) -> None:
+    '''Play interactively, or replay the games given on the command line
+    without prompting'''
+    parser = argparse.ArgumentParser(description = 'Play Othello, or replay games without prompting.')
+    parser.add_argument('records', nargs = '*',
+                        help = 'game record files (.ogr or JSON lines) to replay, - for JSON lines on stdin')
+    parser.add_argument('--moves', help = 'moves of one game as typed in, such as "4, 3; 3, 3"')
+    parser.add_argument('--move-file', help = 'file with the moves of one game as typed in, - for stdin')
+    parser.add_argument('--rows', type = int, default = 8)
+    parser.add_argument('--cols', type = int, default = 8)
+    parser.add_argument('--first', choices = ('black', 'white'), default = 'black')
+    parser.add_argument('--top-left', choices = ('black', 'white'), default = 'white')
+    parser.add_argument('--mode', choices = ('high', 'low'), default = 'high')
+    parser.add_argument('--verbosity', type = int, choices = range(4), default = 1,
+                        help = '0 result, 1 final board, 2 a line per move, 3 every board')
+    args = parser.parse_args(arguments)
+
+    if not args.records and args.moves is None and args.move_file is None:
+        user_interface()
+        return
+
+    played = 0
+    invalid = 0
+    setup = (args.rows, args.cols, _color(args.top_left), _color(args.first), args.mode)
+    if args.moves is not None:
+        played += 1
+        invalid += not replay_game(played, setup + (parse_moves([args.moves]),), args.verbosity)
+    if args.move_file is not None:
+        played += 1
+        if args.move_file == '-':
+            valid = replay_game(played, setup + (parse_moves(sys.stdin),), args.verbosity)
+        else:
+            with open(args.move_file) as lines:
+                valid = replay_game(played, setup + (parse_moves(lines),), args.verbosity)
+        invalid += not valid
+
+    for path in args.records:
+        records = game_record.read_json_records(sys.stdin) if path == '-' else game_record.read_records(path)
+        try:
+            for record in records:
+                played += 1
+                invalid += not replay_game(played, record, args.verbosity, True)
+        except (ValueError, KeyError, game_record.GameRecordError) as error:
+            print('Could not read {}: {}'.format(path, error))
+            invalid += 1
+
+    if played != 1:
+        print('{} games replayed, {} not valid.'.format(played, invalid))
+    if invalid:
+        sys.exit(1)
+
+
 if __name__ == '__main__':
-    user_interface()
+    main()
@@ -0,0 +1,216 @@
+# parallel_search.py
+# Siddhartha Desai
+
+import os
+import time
+import multiprocessing
+import concurrent.futures
+import othello
+import search
+
+# Engine and shared root alpha of a worker process, set by _init_worker
+_worker_engine = None
+_shared_alpha = None
+
+
+#
+# Worker functions
+#
+def _init_worker(shared_alpha) -> None:
+    '''Give the worker process its own engine and the shared root alpha'''
+    global _worker_engine, _shared_alpha
+    _worker_engine = search.SearchEngine()
+    _shared_alpha = shared_alpha
+
+def game_state(game: othello.othello) -> bytes:
+    '''Return the compact state that is sent to the workers'''
+    return game.to_bytes()
+
+def game_from_state(state: bytes) -> othello.othello:
+    '''Rebuild a game from a compact state'''
+    return othello.othello.from_bytes(state)
+
+def _search_root_move(state: bytes, move: tuple, depth: int, alpha: int,
+                      deadline: float) -> tuple:
+    '''Search one root move and return (move, value, alpha, nodes, busy
+    seconds, worker id). The window starts from the best root value found so
+    far by any worker, and a value at or below the returned alpha is only an
+    upper bound. The value is None if the deadline passed first'''
+    start = time.perf_counter()
+    game = game_from_state(state)
+    othello.apply_move(game, move)
+
+    alpha = max(alpha, _shared_alpha.value)
+    try:
+        value = -_worker_engine.search_window(game, depth - 1, -search.INFINITY, -alpha,
+                                              deadline = deadline)
+    except search.SearchTimeout:
+        value = None
+
+    if value is not None and value > alpha:
+        with _shared_alpha.get_lock():
+            if value > _shared_alpha.value:
+                _shared_alpha.value = value
+    return (move, value, alpha, _worker_engine.get_nodes(),
+            time.perf_counter() - start, os.getpid())
+
+
+#
+# Parallel search class
+#
+class ParallelSearch:
+    '''Splits the root moves over a pool of processes. Each iteration of
+    iterative deepening searches the principal variation move first, then
+    hands the younger brothers to the workers with the alpha it established'''
+    def __init__(self, workers: int = None):
+        if workers is None:
+            workers = os.cpu_count()
+        self._workers = workers
+        self._shared_alpha = multiprocessing.Value('q', -search.INFINITY)
+        self._pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers = workers, initializer = _init_worker,
+            initargs = (self._shared_alpha,))
+
+        self._best_move = None
+        self._value = 0
+        self._depth = 0
+        self._nodes = 0
+        self._elapsed = 0.0
+        self._busy = {}
+        self._tasks = {}
+
+    def close(self) -> None:
+        '''Shut down the worker processes'''
+        self._pool.shutdown()
+
+    ### Search methods
+    def search(self, game: othello.othello, time_limit: float = None,
+               max_depth: int = 64) -> tuple:
+        '''Search the game within the time limit (in seconds) and return the
+        best (row, col) move for the current player, or None to pass'''
+        start = time.perf_counter()
+        deadline = None if time_limit is None else start + time_limit
+        self._nodes = 0
+        self._depth = 0
+        self._busy = {}
+        self._tasks = {}
+
+        moves = list(othello.legal_moves(game))
+        if not moves:
+            self._best_move = None
+            self._elapsed = time.perf_counter() - start
+            return None
+        self._best_move = moves[0]
+        self._value = 0
+
+        state = game_state(game)
+        for depth in range(1, max_depth + 1):
+            result = self._search_depth(state, moves, depth, deadline)
+            if result is None:
+                break
+            self._value, self._best_move = result
+            self._depth = depth
+
+            # Search the best move first in the next iteration
+            moves.remove(self._best_move)
+            moves.insert(0, self._best_move)
+            if depth >= game.get_empty_count():
+                break
+
+        self._elapsed = time.perf_counter() - start
+        return self._best_move
+
+    def _search_depth(self, state: bytes, moves: list, depth: int, deadline: float) -> tuple:
+        '''Search every root move to the depth and return (value, move), or
+        None if the deadline passed before the iteration finished'''
+        self._shared_alpha.value = -search.INFINITY
+
+        # Younger brothers wait for the eldest one to set alpha
+        eldest = self._pool.submit(_search_root_move, state, moves[0], depth,
+                                   -search.INFINITY, deadline)
+        best_move, best_value, alpha = self._collect(eldest.result())
+        if best_value is None:
+            return None
+
+        futures = [self._pool.submit(_search_root_move, state, move, depth,
+                                     best_value, deadline)
+                   for move in moves[1:]]
+        timed_out = False
+        for future in concurrent.futures.as_completed(futures):
+            move, value, alpha = self._collect(future.result())
+            if value is None:
+                timed_out = True
+            elif value > alpha and value > best_value:
+                best_move, best_value = move, value
+        if timed_out:
+            return None
+        return best_value, best_move
+
+    def _collect(self, result: tuple) -> tuple:
+        '''Add a worker result to the statistics and return its move, value
+        and alpha'''
+        move, value, alpha, nodes, busy, worker = result
+        self._nodes += nodes
+        self._busy[worker] = self._busy.get(worker, 0.0) + busy
+        self._tasks[worker] = self._tasks.get(worker, 0) + 1
+        return move, value, alpha
+
+    ### Getter methods
+    def get_best_move(self) -> tuple:
+        '''Return the best move of the last search'''
+        return self._best_move
+
+    def get_value(self) -> int:
+        '''Return the value of the best move of the last search'''
+        return self._value
+
+    def get_depth(self) -> int:
+        '''Return the deepest completed iteration of the last search'''
+        return self._depth
+
+    def report(self) -> dict:
+        '''Return the nodes, nodes per second and per-worker utilisation of
+        the last search'''
+        if self._elapsed > 0:
+            nps = self._nodes / self._elapsed
+        else:
+            nps = 0.0
+        workers = {}
+        for worker, busy in self._busy.items():
+            workers[worker] = {'tasks': self._tasks[worker], 'busy': busy,
+                               'utilisation': busy / self._elapsed if self._elapsed else 0.0}
+        return {'move': self._best_move, 'value': self._value, 'depth': self._depth,
+                'nodes': self._nodes, 'elapsed': self._elapsed, 'nps': nps,
+                'workers': workers, 'pool_size': self._workers}
+
+
+#
+# Benchmark functions
+#
+def compare_with_serial(game: othello.othello, depth: int, workers: int = None) -> dict:
+    '''Search the game to a fixed depth with the serial engine and with the
+    parallel search, and return the parallel report with the speed-up'''
+    engine = search.SearchEngine()
+    serial_start = time.perf_counter()
+    engine.search(game, max_depth = depth)
+    serial_elapsed = time.perf_counter() - serial_start
+
+    parallel = ParallelSearch(workers)
+    try:
+        parallel.search(game, max_depth = depth)
+        report = parallel.report()
+    finally:
+        parallel.close()
+
+    report['serial_elapsed'] = serial_elapsed
+    report['serial_nodes'] = engine.get_nodes()
+    report['serial_nps'] = engine.get_nodes() / serial_elapsed if serial_elapsed else 0.0
+    report['speedup'] = serial_elapsed / report['elapsed'] if report['elapsed'] else 0.0
+    return report
+
+
+if __name__ == '__main__':
+    import sys
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    print(compare_with_serial(othello.othello(size, size, 'B', 'W'), depth))
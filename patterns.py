@@ -0,0 +1,355 @@
+# patterns.py
+# Siddhartha Desai
+
+import sys
+import struct
+import argparse
+from array import array
+import othello
+import search
+import game_record
+
+# File header: magic and format version
+MAGIC = b'OPT1'
+HEADER = struct.Struct('>4sI')
+VERSION = 1
+
+# Table block header: rows, cols, mode (0 for 'high', 1 for 'low') and the
+# number of entries. It is followed by the big-endian int16 entries of every
+# family, stage by stage.
+BLOCK_HEADER = struct.Struct('>BBBI')
+
+# Pattern families. Each family is placed at every corner and shares one
+# table between its instances. Lengths are cut down on small boards.
+FAMILIES = ('corner3x3', 'corner2x5', 'edge', 'diagonal')
+
+# Games are split into stages by how many disks are on the board, and each
+# stage has its own tables
+STAGES = 4
+
+# Table entries are in eighths of a disk of final differential
+SCALE = 8
+
+# Base-3 digits of the squares: empty, black, white
+EMPTY = 0
+BLACK = 1
+WHITE = 2
+
+
+#
+# Pattern layout
+#
+_LAYOUTS = {}
+
+def pattern_layout(rows: int, cols: int) -> tuple:
+    '''Return the (instances, lengths, touches) layout of a board size.
+    Instances are (family, squares) pairs with the squares as bit positions,
+    lengths are the number of squares of each family and touches maps a bit
+    position to the (instance, power of 3) pairs of the patterns that read
+    it. Layouts are built once per size'''
+    layout = _LAYOUTS.get((rows, cols))
+    if layout is not None:
+        return layout
+
+    stride = cols + 1
+    short = min(rows, cols)
+    block = min(5, short)
+    edge = min(8, short)
+    corners = ((0, 0, 1, 1), (0, cols - 1, 1, -1),
+               (rows - 1, 0, -1, 1), (rows - 1, cols - 1, -1, -1))
+
+    instances = []
+    for row, col, row_step, col_step in corners:
+        def square(down: int, across: int) -> int:
+            return (row + row_step * down) * stride + col + col_step * across
+        instances.append((0, tuple(square(down, across)
+                                   for down in range(3) for across in range(3))))
+        instances.append((1, tuple(square(down, across)
+                                   for down in range(2) for across in range(block))))
+        instances.append((1, tuple(square(down, across)
+                                   for across in range(2) for down in range(block))))
+        instances.append((2, tuple(square(0, across) for across in range(edge))))
+        instances.append((2, tuple(square(down, 0) for down in range(edge))))
+        instances.append((3, tuple(square(step, step) for step in range(edge))))
+    lengths = (9, 2 * block, edge, edge)
+
+    touches = {}
+    for number, (family, squares) in enumerate(instances):
+        for position, index in enumerate(squares):
+            touches.setdefault(index, []).append((number, 3 ** position))
+    touches = {index: tuple(pairs) for index, pairs in touches.items()}
+
+    layout = (tuple(instances), lengths, touches)
+    _LAYOUTS[(rows, cols)] = layout
+    return layout
+
+def table_entries(rows: int, cols: int) -> int:
+    '''Return the number of entries of all the tables of a board size and
+    mode'''
+    instances, lengths, touches = pattern_layout(rows, cols)
+    return STAGES * sum(3 ** length for length in lengths)
+
+def stage(game: othello.othello) -> int:
+    '''Return the stage of the game from how full the board is'''
+    squares = game.get_num_rows() * game.get_num_cols()
+    return (squares - game.get_empty_count()) * STAGES // (squares + 1)
+
+
+#
+# Pattern index class
+#
+class PatternIndices:
+    '''Base-3 index of every pattern instance of a board size. Attached to a
+    game with set_patterns, the indices follow every disk that is placed,
+    flipped or taken back, so evaluating a position is only table lookups'''
+    __slots__ = ('_rows', '_cols', '_touches', '_indices')
+
+    def __init__(self, rows: int, cols: int):
+        instances, lengths, self._touches = pattern_layout(rows, cols)
+        self._rows = rows
+        self._cols = cols
+        self._indices = [0] * len(instances)
+
+    def reset(self, white: int, black: int) -> None:
+        '''Recompute every index from the bitboards'''
+        instances, lengths, touches = pattern_layout(self._rows, self._cols)
+        for number, (family, squares) in enumerate(instances):
+            index = 0
+            for index_square in reversed(squares):
+                bit = 1 << index_square
+                index *= 3
+                if black & bit:
+                    index += BLACK
+                elif white & bit:
+                    index += WHITE
+            self._indices[number] = index
+
+    def place(self, bit: int, flips: int, turn: str) -> None:
+        '''Add a disk of the turn's color on the square bit and flip the disks
+        in the flips mask to it'''
+        # Black's digit is 1 and white's 2, so a flip to black takes 1 off
+        if turn == 'B':
+            self._update(bit, flips, BLACK, -1)
+        else:
+            self._update(bit, flips, WHITE, 1)
+
+    def remove(self, bit: int, flips: int, turn: str) -> None:
+        '''Take back a disk placed with place'''
+        if turn == 'B':
+            self._update(bit, flips, -BLACK, 1)
+        else:
+            self._update(bit, flips, -WHITE, -1)
+
+    def _update(self, bit: int, flips: int, placed: int, flipped: int) -> None:
+        '''Add placed to the digit of the square bit and flipped to the digit
+        of every square in the flips mask'''
+        indices = self._indices
+        touches = self._touches
+        for number, power in touches.get(bit.bit_length() - 1, ()):
+            indices[number] += placed * power
+        while flips:
+            flip = flips & -flips
+            flips ^= flip
+            for number, power in touches.get(flip.bit_length() - 1, ()):
+                indices[number] += flipped * power
+
+    def clone(self) -> 'PatternIndices':
+        '''Return an independent copy'''
+        copy = PatternIndices.__new__(PatternIndices)
+        copy._rows = self._rows
+        copy._cols = self._cols
+        copy._touches = self._touches
+        copy._indices = list(self._indices)
+        return copy
+
+    def get_size(self) -> tuple:
+        '''Return the (rows, cols) of the board size'''
+        return self._rows, self._cols
+
+    def get_indices(self) -> list:
+        '''Return the index of every pattern instance'''
+        return self._indices
+
+
+#
+# Evaluator class
+#
+class PatternEvaluator:
+    '''Table-driven evaluation function for SearchEngine. The value of a
+    position is the sum of the table entries of its pattern instances for
+    the game's stage, from black's side, turned to the player to move. Board
+    sizes and modes without tables fall back to another evaluation'''
+    def __init__(self, tables: dict, fallback = search.evaluate):
+        '''Takes tables as read by read_tables'''
+        self._tables = tables
+        self._fallback = fallback
+
+    def __call__(self, game: othello.othello, mode: str) -> int:
+        '''Return the value of the position for the player to move'''
+        rows = game.get_num_rows(); cols = game.get_num_cols()
+        tables = self._tables.get((rows, cols, mode))
+        if tables is None:
+            return self._fallback(game, mode)
+
+        # A position where neither player can move gets its final value
+        own, opp = game.get_player_masks()
+        full = game.get_full_mask()
+        directions = game.get_directions()
+        if (game.get_empty_count() == 0 or
+            not othello._fill_moves(own, opp, full, directions) and
+            not othello._fill_moves(opp, own, full, directions)):
+            return search.final_value(game, mode)
+
+        patterns = game.get_patterns()
+        if patterns is None or patterns.get_size() != (rows, cols):
+            patterns = PatternIndices(rows, cols)
+            game.set_patterns(patterns)
+
+        instances, lengths, touches = pattern_layout(rows, cols)
+        stage_tables = tables[stage(game)]
+        value = 0
+        for (family, squares), index in zip(instances, patterns.get_indices()):
+            value += stage_tables[family][index]
+        if game.current_turn() == 'W':
+            value = -value
+
+        # Stay below the value of any won game
+        limit = search.FINAL_WEIGHT - 1
+        return max(-limit, min(limit, value))
+
+    def get_tables(self) -> dict:
+        '''Return the tables'''
+        return self._tables
+
+
+#
+# Table file functions
+#
+def read_tables(path: str) -> dict:
+    '''Return the tables of a file as {(rows, cols, mode): [stage][family]
+    arrays of int16 entries}'''
+    tables = {}
+    with open(path, 'rb') as source:
+        header = source.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError('{} is too small to be a pattern table file'.format(path))
+        magic, version = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a version {} pattern table file'.format(path, VERSION))
+
+        while True:
+            header = source.read(BLOCK_HEADER.size)
+            if not header:
+                break
+            if len(header) < BLOCK_HEADER.size:
+                raise ValueError('Truncated table header in {}'.format(path))
+            rows, cols, mode, count = BLOCK_HEADER.unpack(header)
+            if count != table_entries(rows, cols):
+                raise ValueError('Wrong number of entries for {}x{} in {}'.format(rows, cols, path))
+            entries = array('h')
+            entries.frombytes(source.read(count * entries.itemsize))
+            if len(entries) != count:
+                raise ValueError('Truncated tables in {}'.format(path))
+            if sys.byteorder == 'little':
+                entries.byteswap()
+
+            instances, lengths, touches = pattern_layout(rows, cols)
+            stages = []
+            start = 0
+            for number in range(STAGES):
+                families = []
+                for length in lengths:
+                    families.append(entries[start:start + 3 ** length])
+                    start += 3 ** length
+                stages.append(families)
+            tables[(rows, cols, 'low' if mode else 'high')] = stages
+    return tables
+
+def write_tables(tables: dict, path: str) -> None:
+    '''Write tables shaped like those of read_tables. Entries may be floats
+    in disks of final differential, as made by fit; they are scaled by SCALE
+    and rounded into int16'''
+    with open(path, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, VERSION))
+        for rows, cols, mode in sorted(tables):
+            entries = array('h')
+            for families in tables[(rows, cols, mode)]:
+                for family in families:
+                    if isinstance(family, array) and family.typecode == 'h':
+                        entries.extend(family)
+                    else:
+                        entries.extend(max(-32768, min(32767, round(value * SCALE)))
+                                       for value in family)
+            if sys.byteorder == 'little':
+                entries.byteswap()
+            output.write(BLOCK_HEADER.pack(rows, cols, int(mode == 'low'), len(entries)))
+            output.write(entries.tobytes())
+
+
+#
+# Training functions
+#
+def empty_tables(rows: int, cols: int) -> list:
+    '''Return [stage][family] lists of zero weights for a board size'''
+    instances, lengths, touches = pattern_layout(rows, cols)
+    return [[[0.0] * 3 ** length for length in lengths] for number in range(STAGES)]
+
+def fit(paths: list, epochs: int = 2, rate: float = 0.01) -> dict:
+    '''Fit weights to the final disk differential of the games in JSON-lines
+    or .ogr record files by stochastic gradient descent, and return them as
+    {(rows, cols, mode): [stage][family] lists} for write_tables. In 'low'
+    mode the differential is negated, so that higher is always better'''
+    weights = {}
+    for epoch in range(epochs):
+        for path in paths:
+            for record in game_record.read_records(path):
+                _fit_game(weights, record, rate)
+    return weights
+
+def _fit_game(weights: dict, record: tuple, rate: float) -> None:
+    '''Replay one game and move the weights of each of its positions
+    towards the final result'''
+    rows, cols, top_left, turn, mode, moves = record
+    game = othello.othello(rows, cols, turn, top_left, mode)
+    game.set_patterns(PatternIndices(rows, cols))
+    instances, lengths, touches = pattern_layout(rows, cols)
+
+    positions = []
+    for move in moves:
+        positions.append((stage(game), list(game.get_patterns().get_indices())))
+        if move is None:
+            othello.apply_move(game, None)
+        else:
+            othello.apply_move(game, tuple(move))
+    result = search.mode_sign(mode) * (game.get_black_score() - game.get_white_score())
+
+    tables = weights.get((rows, cols, mode))
+    if tables is None:
+        tables = weights[(rows, cols, mode)] = empty_tables(rows, cols)
+    for number, indices in positions:
+        stage_tables = tables[number]
+        predicted = 0.0
+        for (family, squares), index in zip(instances, indices):
+            predicted += stage_tables[family][index]
+        step = rate * (result - predicted)
+        for (family, squares), index in zip(instances, indices):
+            stage_tables[family][index] += step
+
+
+def main(arguments: list = None) -> None:
+    '''Fit pattern tables from the command line'''
+    parser = argparse.ArgumentParser(description = 'Fit Othello pattern tables.')
+    parser.add_argument('tables')
+    parser.add_argument('records', nargs = '+', help = 'JSON-lines or .ogr game record files')
+    parser.add_argument('--epochs', type = int, default = 2)
+    parser.add_argument('--rate', type = float, default = 0.01)
+    args = parser.parse_args(arguments)
+
+    weights = fit(args.records, args.epochs, args.rate)
+    write_tables(weights, args.tables)
+    print('Wrote tables for {} board sizes and modes to {}'.format(len(weights), args.tables),
+          file = sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# ponder.py
+# Siddhartha Desai
+
+import time
+import threading
+import othello
+import search
+
+# Seconds between stop requests while waiting for the pondering thread
+STOP_INTERVAL = 0.05
+
+
+#
+# Pondering class
+#
+class Ponderer:
+    '''Searches on the opponent's time. While the opponent thinks, the engine
+    searches the position after the reply its principal variation predicts,
+    or the opponent's own position if there is no prediction, on a
+    background thread. Either way the work lands in the engine's
+    transposition table. If the opponent plays the predicted reply, the
+    time already pondered counts towards the move's time limit'''
+    def __init__(self, engine: search.SearchEngine = None):
+        if engine is None:
+            engine = search.SearchEngine()
+        self._engine = engine
+        self._thread = None
+        self._position = None
+        self._hash = None
+        self._predicted = False
+        self._start = 0.0
+        self._hits = 0
+        self._misses = 0
+
+    ### Pondering methods
+    def start(self, game: othello.othello) -> None:
+        '''Start pondering a game where the opponent is to move. Does nothing
+        if that position is already being pondered'''
+        if self._thread is not None:
+            if self._position == game.get_hash():
+                return
+            self.stop()
+        if not othello.legal_moves(game):
+            return
+        self._position = game.get_hash()
+
+        position = game.clone()
+        pv = self._engine.get_pv()
+        self._predicted = len(pv) > 1 and pv[1] in othello.legal_moves(position)
+        if self._predicted:
+            othello.apply_move(position, pv[1])
+            if not othello.legal_moves(position):
+                return
+        # The position pondered, checked by choose_move
+        self._hash = position.get_hash()
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target = self._engine.search, args = (position,),
+                                        daemon = True)
+        self._thread.start()
+
+    def stop(self) -> float:
+        '''Stop pondering and return how many seconds were pondered'''
+        if self._thread is None:
+            return 0.0
+        # The search may not have started yet when the first stop comes
+        while self._thread.is_alive():
+            self._engine.stop()
+            self._thread.join(STOP_INTERVAL)
+        self._thread = None
+        return time.perf_counter() - self._start
+
+    def choose_move(self, game: othello.othello, time_limit: float) -> tuple:
+        '''Return the engine's move for the game, where it is the engine's
+        turn, within the time limit in seconds. If the position is the one
+        being pondered, the pondered time is taken off the limit'''
+        hit = self._thread is not None and self._hash == game.get_hash()
+        pondered = self.stop()
+        if not hit:
+            if self._hash is not None and self._predicted:
+                self._misses += 1
+            self._hash = None
+            return self._engine.search(game, time_limit = time_limit)
+
+        self._hits += 1
+        self._hash = None
+        if pondered >= time_limit and self._engine.get_best_move() in othello.legal_moves(game):
+            return self._engine.get_best_move()
+        return self._engine.search(game, time_limit = max(0.0, time_limit - pondered))
+
+    ### Getter methods
+    def get_engine(self) -> search.SearchEngine:
+        '''Return the engine'''
+        return self._engine
+
+    def get_hits(self) -> int:
+        '''Return how many times the pondered position was played'''
+        return self._hits
+
+    def get_misses(self) -> int:
+        '''Return how many times another position was played'''
+        return self._misses
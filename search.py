@@ -0,0 +1,414 @@
+# search.py
+# Siddhartha Desai
+
+import time
+import othello
+import transposition
+import endgame
+import opening_book
+
+# Value of one disk of final differential. Any won game is worth more than
+# the largest heuristic value.
+FINAL_WEIGHT = 1000
+
+# Heuristic weights
+CORNER_WEIGHT = 30
+MOBILITY_WEIGHT = 4
+DISK_WEIGHT = 1
+
+# Half width of the aspiration window around the previous iteration's value
+ASPIRATION_WINDOW = 50
+
+# How many nodes are searched between clock checks
+CHECK_INTERVAL = 256
+
+INFINITY = 1 << 30
+
+
+class SearchTimeout(Exception):
+    '''Raised inside the search when the time or node budget runs out'''
+    pass
+
+
+#
+# Evaluation functions
+#
+_CORNER_MASKS = {}
+
+def _corner_mask(game: othello.othello) -> int:
+    '''Return the mask of the 4 corners of the board'''
+    size = (game.get_num_rows(), game.get_num_cols())
+    mask = _CORNER_MASKS.get(size)
+    if mask is None:
+        last_row = game.get_num_rows() - 1
+        last_col = game.get_num_cols() - 1
+        mask = (game.get_square_bit(0, 0) | game.get_square_bit(0, last_col) |
+                game.get_square_bit(last_row, 0) | game.get_square_bit(last_row, last_col))
+        _CORNER_MASKS[size] = mask
+    return mask
+
+def mode_sign(mode: str) -> int:
+    '''Return 1 if more disks are better in the mode, -1 if fewer are'''
+    if mode == 'low':
+        return -1
+    return 1
+
+def final_value(game: othello.othello, mode: str) -> int:
+    '''Return the value of a finished game for the player to move'''
+    own, opp = game.get_player_masks()
+    return mode_sign(mode) * (own.bit_count() - opp.bit_count()) * FINAL_WEIGHT
+
+def evaluate(game: othello.othello, mode: str) -> int:
+    '''Return a heuristic value of the position for the player to move. Disks
+    and corners count in the direction of the mode, mobility always helps. A
+    position where neither player can move gets its final value'''
+    own, opp = game.get_player_masks()
+    full = game.get_full_mask()
+    directions = game.get_directions()
+    corners = _corner_mask(game)
+
+    disks = own.bit_count() - opp.bit_count()
+    corner = (own & corners).bit_count() - (opp & corners).bit_count()
+    own_moves = othello._fill_moves(own, opp, full, directions).bit_count()
+    opp_moves = othello._fill_moves(opp, own, full, directions).bit_count()
+    if own_moves == 0 and opp_moves == 0:
+        return final_value(game, mode)
+    mobility = own_moves - opp_moves
+
+    return (mode_sign(mode) * (disks * DISK_WEIGHT + corner * CORNER_WEIGHT) +
+            mobility * MOBILITY_WEIGHT)
+
+
+#
+# Search engine
+#
+class SearchEngine:
+    '''Negamax alpha-beta search with iterative deepening, aspiration windows
+    and a transposition table that carries the principal variation from one
+    iteration to the next'''
+    def __init__(self, table: transposition.TranspositionTable = None, evaluate = evaluate,
+                 endgame_solver: endgame.EndgameSolver = None, book = None,
+                 book_min_games: int = opening_book.DEFAULT_MIN_GAMES,
+                 book_min_score: float = opening_book.DEFAULT_MIN_SCORE):
+        if table is None:
+            table = transposition.TranspositionTable()
+        self._table = table
+        self._evaluate = evaluate
+        self._endgame = endgame_solver
+        self._book = book
+        self._book_min_games = book_min_games
+        self._book_min_score = book_min_score
+
+        self._mode = 'high'
+        self._key_flip = 0
+        self._deadline = None
+        self._node_limit = None
+        self._nodes = 0
+        self._next_check = 0
+        self._stopped = False
+
+        self._best_move = None
+        self._value = 0
+        self._depth = 0
+        self._pv = []
+        self._elapsed = 0.0
+
+    ### Search methods
+    def search(self, game: othello.othello, time_limit: float = None,
+               node_limit: int = None, max_depth: int = 64, mode: str = None) -> tuple:
+        '''Search the game within the time (in seconds) and node budgets and
+        return the best (row, col) move for the current player, or None if the
+        player has to pass. The game is left as it was given'''
+        start = time.perf_counter()
+        if mode is None:
+            mode = game.get_mode()
+        self._mode = mode
+        self._key_flip = _key_flip(game, mode)
+        self._deadline = None if time_limit is None else start + time_limit
+        self._node_limit = node_limit
+        self._nodes = 0
+        self._next_check = CHECK_INTERVAL
+        self._stopped = False
+        self._depth = 0
+        self._pv = []
+
+        moves = othello.legal_moves(game)
+        if not moves:
+            self._best_move = None
+            self._value = 0
+            self._elapsed = time.perf_counter() - start
+            return None
+
+        # Play straight from the opening book while the position is in it.
+        # The book's statistics are for the game's own mode
+        if self._book is not None and mode == game.get_mode():
+            move = self._book.best_move(game, self._book_min_games, self._book_min_score)
+            if move is not None and move in moves:
+                self._best_move = move
+                self._value = 0
+                self._elapsed = time.perf_counter() - start
+                return move
+
+        # Play perfectly once the endgame solver can take over. It gets half
+        # of the time, and the search below the rest if it runs out
+        if self._endgame is not None and self._endgame.can_solve(game):
+            deadline = None if time_limit is None else start + time_limit / 2
+            try:
+                value, self._best_move = self._endgame.solve(game, mode, deadline)
+            except endgame.SolveTimeout:
+                pass
+            else:
+                self._value = value * FINAL_WEIGHT
+                self._depth = game.get_empty_count()
+                self._pv = [self._best_move]
+                self._nodes = self._endgame.get_nodes()
+                self._elapsed = time.perf_counter() - start
+                return self._best_move
+
+        # Always have a move to fall back on
+        self._best_move = self._order_moves(game, moves, None)[0][0]
+        self._value = 0
+        undo_depth = game.get_undo_depth()
+
+        for depth in range(1, max_depth + 1):
+            try:
+                value, move = self._aspiration_search(game, depth)
+            except SearchTimeout as timeout:
+                while game.get_undo_depth() > undo_depth:
+                    game.pop_move()
+                # Keep a root move that was fully searched in this iteration
+                if timeout.args and timeout.args[0] is not None:
+                    self._best_move, self._value = timeout.args[0]
+                break
+            self._best_move = move
+            self._value = value
+            self._depth = depth
+            self._pv = self._principal_variation(game, depth)
+
+            # Stop once the whole game tree has been searched
+            if depth >= game.get_empty_count():
+                break
+
+        self._elapsed = time.perf_counter() - start
+        return self._best_move
+
+    def search_window(self, game: othello.othello, depth: int, alpha: int, beta: int,
+                      mode: str = None, deadline: float = None) -> int:
+        '''Return the value of the game for the player to move, searched to
+        a fixed depth in the (alpha, beta) window. Raises SearchTimeout if the
+        time.perf_counter() deadline passes first'''
+        if mode is None:
+            mode = game.get_mode()
+        self._mode = mode
+        self._key_flip = _key_flip(game, mode)
+        self._deadline = deadline
+        self._node_limit = None
+        self._nodes = 0
+        self._next_check = CHECK_INTERVAL
+        return self._negamax(game, depth, alpha, beta)
+
+    def stop(self) -> None:
+        '''Make a running search return its best move so far as soon as it
+        next checks its budget. Safe to call from another thread'''
+        self._stopped = True
+        if self._endgame is not None:
+            self._endgame.stop()
+
+    def _aspiration_search(self, game: othello.othello, depth: int) -> tuple:
+        '''Search the root in a window around the previous value, and widen
+        the window if the value falls outside of it'''
+        if depth == 1:
+            return self._root(game, depth, -INFINITY, INFINITY)
+        alpha = self._value - ASPIRATION_WINDOW
+        beta = self._value + ASPIRATION_WINDOW
+        value, move = self._root(game, depth, alpha, beta)
+        if value <= alpha or value >= beta:
+            value, move = self._root(game, depth, -INFINITY, INFINITY)
+        return value, move
+
+    def _root(self, game: othello.othello, depth: int, alpha: int, beta: int) -> tuple:
+        '''Search every root move and return the best value and move'''
+        moves = othello.legal_moves(game)
+        best_value = -INFINITY
+        best_move = None
+        for move, flips in self._order_moves(game, moves, self._best_move):
+            game.push_move(game.get_square_bit(move[0], move[1]), flips)
+            try:
+                value = -self._negamax(game, depth - 1, -beta, -max(alpha, best_value))
+            except SearchTimeout:
+                game.pop_move()
+                if best_move is None or best_value <= alpha:
+                    raise SearchTimeout(None)
+                raise SearchTimeout((best_move, best_value))
+            game.pop_move()
+            if value > best_value:
+                best_value = value
+                best_move = move
+                if value >= beta:
+                    break
+        self._table.store(game.get_hash() ^ self._key_flip, depth, best_value,
+                          _bound(best_value, alpha, beta), best_move)
+        return best_value, best_move
+
+    def _negamax(self, game: othello.othello, depth: int, alpha: int, beta: int) -> int:
+        '''Return the value of the position for the player to move'''
+        self._nodes += 1
+        if self._nodes >= self._next_check:
+            self._check_budget()
+
+        key = game.get_hash() ^ self._key_flip
+        entry = self._table.probe(key)
+        hash_move = None
+        if entry is not None:
+            hash_move = entry[4]
+            if entry[1] >= depth:
+                value = entry[2]
+                if entry[3] == transposition.EXACT:
+                    return value
+                if entry[3] == transposition.LOWER and value >= beta:
+                    return value
+                if entry[3] == transposition.UPPER and value <= alpha:
+                    return value
+
+        if depth <= 0:
+            return self._evaluate(game, self._mode)
+
+        moves = othello.legal_moves(game)
+        if not moves:
+            game.push_move(0, 0)
+            if not othello.legal_moves(game):
+                game.pop_move()
+                return final_value(game, self._mode)
+            try:
+                value = -self._negamax(game, depth, -beta, -alpha)
+            finally:
+                game.pop_move()
+            return value
+
+        original_alpha = alpha
+        best_value = -INFINITY
+        best_move = None
+        for move, flips in self._order_moves(game, moves, hash_move):
+            game.push_move(game.get_square_bit(move[0], move[1]), flips)
+            try:
+                value = -self._negamax(game, depth - 1, -beta, -alpha)
+            finally:
+                game.pop_move()
+            if value > best_value:
+                best_value = value
+                best_move = move
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        self._table.store(key, depth, best_value,
+                          _bound(best_value, original_alpha, beta), best_move)
+        return best_value
+
+    def _check_budget(self) -> None:
+        '''Raise SearchTimeout if the time or node budget has run out'''
+        self._next_check = self._nodes + CHECK_INTERVAL
+        if self._stopped:
+            raise SearchTimeout()
+        if self._node_limit is not None and self._nodes >= self._node_limit:
+            raise SearchTimeout()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchTimeout()
+
+    def _order_moves(self, game: othello.othello, moves: dict, first: tuple) -> list:
+        '''Return the (move, flips) pairs with the given move first, then the
+        corners, then the rest'''
+        corners = _corner_mask(game)
+        scored = []
+        for move, flips in moves.items():
+            if move == first:
+                score = 2
+            elif game.get_square_bit(move[0], move[1]) & corners:
+                score = 1
+            else:
+                score = 0
+            scored.append((score, move, flips))
+        scored.sort(key = lambda item: item[0], reverse = True)
+        return [(move, flips) for score, move, flips in scored]
+
+    def _principal_variation(self, game: othello.othello, depth: int) -> list:
+        '''Follow the best moves stored in the transposition table'''
+        pv = []
+        for ply in range(depth):
+            entry = self._table.probe(game.get_hash() ^ self._key_flip)
+            if entry is None or entry[4] is None:
+                break
+            move = entry[4]
+            flips = othello.legal_moves(game).get(move)
+            if not flips:
+                break
+            pv.append(move)
+            game.push_move(game.get_square_bit(move[0], move[1]), flips)
+        for move in pv:
+            game.pop_move()
+        return pv
+
+    ### Setter methods
+    def set_book_limits(self, min_games: int, min_score: float) -> None:
+        '''Set how many games a book move must have been played in, and the
+        fraction of them it must have scored, to be played without a search'''
+        self._book_min_games = min_games
+        self._book_min_score = min_score
+
+    ### Getter methods
+    def get_best_move(self) -> tuple:
+        '''Return the best move of the last search'''
+        return self._best_move
+
+    def get_value(self) -> int:
+        '''Return the value of the best move of the last search'''
+        return self._value
+
+    def get_depth(self) -> int:
+        '''Return the deepest completed iteration of the last search'''
+        return self._depth
+
+    def get_pv(self) -> list:
+        '''Return the principal variation of the last completed iteration'''
+        return self._pv
+
+    def get_nodes(self) -> int:
+        '''Return the number of nodes searched by the last search'''
+        return self._nodes
+
+    def get_elapsed(self) -> float:
+        '''Return how many seconds the last search took'''
+        return self._elapsed
+
+    def get_table(self) -> transposition.TranspositionTable:
+        '''Return the transposition table'''
+        return self._table
+
+    def get_book_limits(self) -> tuple:
+        '''Return the (min games, min score) a book move needs'''
+        return self._book_min_games, self._book_min_score
+
+
+#
+# Search functions
+#
+def _key_flip(game: othello.othello, mode: str) -> int:
+    '''Return what to XOR into the game's hash so that the transposition
+    table key holds the mode being searched rather than the game's own'''
+    if mode == game.get_mode():
+        return 0
+    return game.get_mode_key()
+
+def _bound(value: int, alpha: int, beta: int) -> int:
+    '''Return which kind of bound a value searched in (alpha, beta) is'''
+    if value <= alpha:
+        return transposition.UPPER
+    if value >= beta:
+        return transposition.LOWER
+    return transposition.EXACT
+
+def find_best_move(game: othello.othello, time_limit: float = 1.0,
+                   node_limit: int = None, mode: str = None) -> tuple:
+    '''Search the game with a fresh engine and return the best move'''
+    return SearchEngine().search(game, time_limit, node_limit, mode = mode)
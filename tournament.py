@@ -0,0 +1,234 @@
+# tournament.py
+# Siddhartha Desai
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import concurrent.futures
+import othello
+import search
+import endgame
+import mcts
+import patterns
+import game_record
+
+
+#
+# Players
+#
+# A player is made from a 'name' or 'name:argument' spec in the worker that
+# plays the game, and is called with the game to return a (row, col) move.
+def random_player(argument: str, seed: int):
+    '''Play a uniformly random legal move'''
+    generator = random.Random(seed)
+    def play(game: othello.othello) -> tuple:
+        return generator.choice(list(othello.legal_moves(game)))
+    return play
+
+def greedy_player(argument: str, seed: int):
+    '''Play the move that flips the most disks, or the fewest in low mode'''
+    def play(game: othello.othello) -> tuple:
+        sign = search.mode_sign(game.get_mode())
+        moves = othello.legal_moves(game)
+        return max(moves, key = lambda move: sign * moves[move].bit_count())
+    return play
+
+def alphabeta_player(argument: str, seed: int):
+    '''Search with the alpha-beta engine for the given seconds per move'''
+    time_limit = float(argument) if argument else 0.1
+    engine = search.SearchEngine(endgame_solver = endgame.EndgameSolver(10))
+    def play(game: othello.othello) -> tuple:
+        return engine.search(game, time_limit = time_limit)
+    return play
+
+_PATTERN_TABLES = {}
+
+def patterns_player(argument: str, seed: int):
+    '''Search with the alpha-beta engine and the pattern tables of the given
+    file for 0.1 seconds per move. Tables are read once per worker'''
+    tables = _PATTERN_TABLES.get(argument)
+    if tables is None:
+        tables = _PATTERN_TABLES[argument] = patterns.read_tables(argument)
+    engine = search.SearchEngine(evaluate = patterns.PatternEvaluator(tables),
+                                 endgame_solver = endgame.EndgameSolver(10))
+    def play(game: othello.othello) -> tuple:
+        return engine.search(game, time_limit = 0.1)
+    return play
+
+def mcts_player(argument: str, seed: int):
+    '''Search with MCTS for the given number of playouts per move'''
+    playouts = int(argument) if argument else 200
+    player = mcts.MCTSPlayer(seed = seed)
+    def play(game: othello.othello) -> tuple:
+        return player.search(game, playouts = playouts)
+    return play
+
+PLAYERS = {
+    'random': random_player,
+    'greedy': greedy_player,
+    'alphabeta': alphabeta_player,
+    'patterns': patterns_player,
+    'mcts': mcts_player,
+}
+
+def make_player(spec: str, seed: int):
+    '''Return the player described by a 'name' or 'name:argument' spec'''
+    name, separator, argument = spec.partition(':')
+    if name not in PLAYERS:
+        raise ValueError('Unknown player: {}'.format(name))
+    return PLAYERS[name](argument, seed)
+
+
+#
+# Game functions
+#
+def play_game(config: dict) -> dict:
+    '''Play one game headless and return its record: the config, the winner,
+    the final scores, the moves (None for a pass) and the seconds each move
+    took'''
+    game = othello.othello(config['rows'], config['cols'], config['turn'],
+                           config['top_left'], config['mode'])
+    players = {'B': make_player(config['black'], config['seed']),
+               'W': make_player(config['white'], config['seed'] + 1)}
+
+    moves = []
+    times = []
+    passes = 0
+    start = time.perf_counter()
+    while passes < 2:
+        if not othello.legal_moves(game):
+            othello.apply_move(game, None)
+            moves.append(None)
+            times.append(0.0)
+            passes += 1
+            continue
+        passes = 0
+        move_start = time.perf_counter()
+        move = players[game.current_turn()](game)
+        times.append(time.perf_counter() - move_start)
+        othello.apply_move(game, move)
+        moves.append(list(move))
+
+    record = dict(config)
+    record['winner'] = othello.winning_player(game, True, config['mode'])
+    record['white_score'] = game.get_white_score()
+    record['black_score'] = game.get_black_score()
+    record['moves'] = moves
+    record['move_times'] = times
+    record['elapsed'] = time.perf_counter() - start
+    return record
+
+def game_configs(games: int, sizes: list, top_lefts: list, modes: list,
+                 first_turn: str, player1: str, player2: str, seed: int):
+    '''Generate the configs of the games, cycling through the sizes, top left
+    colors and modes. The two players swap colors every game'''
+    settings = itertools.cycle(itertools.product(sizes, top_lefts, modes))
+    for index in range(games):
+        (rows, cols), top_left, mode = next(settings)
+        if index % 2 == 0:
+            black, white = player1, player2
+        else:
+            black, white = player2, player1
+        yield {'index': index, 'rows': rows, 'cols': cols, 'top_left': top_left,
+               'turn': first_turn, 'mode': mode, 'black': black, 'white': white,
+               'seed': seed + 2 * index}
+
+
+#
+# Tournament functions
+#
+def run_tournament(configs, write, workers: int = None, progress = None) -> dict:
+    '''Play every game config over a process pool and pass each record to
+    write as soon as the game finishes. Only a few games per worker are
+    queued at a time. Returns the tournament summary'''
+    if workers is None:
+        workers = os.cpu_count()
+    configs = iter(configs)
+    wins = {}
+    games = 0
+    start = time.perf_counter()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as pool:
+        pending = set()
+        for config in itertools.islice(configs, workers * 4):
+            pending.add(pool.submit(play_game, config))
+
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when = concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                record = future.result()
+                write(record)
+
+                games += 1
+                winner = record['winner']
+                if winner == 'B':
+                    name = record['black']
+                elif winner == 'W':
+                    name = record['white']
+                else:
+                    name = 'draw'
+                wins[name] = wins.get(name, 0) + 1
+                if progress is not None:
+                    progress(games, time.perf_counter() - start)
+
+            for config in itertools.islice(configs, len(done)):
+                pending.add(pool.submit(play_game, config))
+
+    elapsed = time.perf_counter() - start
+    return {'games': games, 'elapsed': elapsed,
+            'games_per_second': games / elapsed if elapsed else 0.0,
+            'wins': wins, 'workers': workers}
+
+
+def _parse_size(size: str) -> tuple:
+    '''Turn a 'ROWSxCOLS' argument into (rows, cols)'''
+    rows, separator, cols = size.lower().partition('x')
+    return int(rows), int(cols or rows)
+
+def main(arguments: list = None) -> None:
+    '''Run a tournament from the command line'''
+    parser = argparse.ArgumentParser(description = 'Play headless Othello games.')
+    parser.add_argument('--games', type = int, default = 100)
+    parser.add_argument('--size', action = 'append', type = _parse_size,
+                        help = 'board size as ROWSxCOLS, may be repeated (default 8x8)')
+    parser.add_argument('--top-left', action = 'append', choices = ('W', 'B'),
+                        help = 'top left color, may be repeated (default W)')
+    parser.add_argument('--mode', action = 'append', choices = ('high', 'low'),
+                        help = 'scoring mode, may be repeated (default high)')
+    parser.add_argument('--first', choices = ('W', 'B'), default = 'B')
+    parser.add_argument('--player1', default = 'random')
+    parser.add_argument('--player2', default = 'greedy')
+    parser.add_argument('--workers', type = int, default = None)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', default = 'results.jsonl',
+                        help = 'JSON lines, or binary game records if it ends in .ogr')
+    args = parser.parse_args(arguments)
+
+    configs = game_configs(args.games, args.size or [(8, 8)], args.top_left or ['W'],
+                           args.mode or ['high'], args.first, args.player1,
+                           args.player2, args.seed)
+
+    def progress(games: int, elapsed: float) -> None:
+        if games % 100 == 0:
+            print('{} games, {:.1f} games/s'.format(games, games / elapsed), file = sys.stderr)
+
+    if args.output.endswith('.ogr'):
+        with open(args.output, 'ab') as output:
+            writer = game_record.GameRecordWriter(output)
+            summary = run_tournament(configs, writer.write_record, args.workers, progress)
+    else:
+        with open(args.output, 'a') as output:
+            def write(record: dict) -> None:
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+            summary = run_tournament(configs, write, args.workers, progress)
+    print(json.dumps(summary))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# transposition.py
+# Siddhartha Desai
+
+# Bound types stored with each value
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+class TranspositionTable:
+    '''Fixed size table of searched positions keyed by othello.get_hash().
+    Every bucket has a depth-preferred slot, which only gives way to a search
+    at least as deep, and an always-replace slot for everything else'''
+    def __init__(self, size: int = 1 << 16):
+        # Round the size up to a power of 2 so the index is a mask of the key
+        buckets = 1
+        while buckets < size:
+            buckets *= 2
+        self._mask = buckets - 1
+        self._deep = [None] * buckets
+        self._recent = [None] * buckets
+
+        self._probes = 0
+        self._hits = 0
+        self._stores = 0
+        self._overwrites = 0
+
+    def probe(self, key: int) -> tuple:
+        '''Return the (key, depth, value, bound, move) entry stored for the
+        key, or None if the position is not in the table'''
+        self._probes += 1
+        index = key & self._mask
+        entry = self._deep[index]
+        if entry is not None and entry[0] == key:
+            self._hits += 1
+            return entry
+        entry = self._recent[index]
+        if entry is not None and entry[0] == key:
+            self._hits += 1
+            return entry
+        return None
+
+    def store(self, key: int, depth: int, value: int, bound: int, move) -> None:
+        '''Store a search result. It goes in the depth-preferred slot if that
+        slot is empty, holds the same position or holds a shallower search,
+        in which case the old entry moves to the always-replace slot'''
+        self._stores += 1
+        index = key & self._mask
+        entry = (key, depth, value, bound, move)
+        deep = self._deep[index]
+        if deep is None or deep[0] == key or depth >= deep[1]:
+            if deep is not None and deep[0] != key:
+                self._replace_recent(index, deep)
+            self._deep[index] = entry
+        else:
+            self._replace_recent(index, entry)
+
+    def _replace_recent(self, index: int, entry: tuple) -> None:
+        '''Put an entry in the always-replace slot'''
+        if self._recent[index] is not None:
+            self._overwrites += 1
+        self._recent[index] = entry
+
+    def clear(self) -> None:
+        '''Empty the table and reset the statistics'''
+        self.__init__(self._mask + 1)
+
+    def __len__(self) -> int:
+        '''Return the number of stored entries'''
+        count = 0
+        for entry in self._deep:
+            if entry is not None:
+                count += 1
+        for entry in self._recent:
+            if entry is not None:
+                count += 1
+        return count
+
+    def stats(self) -> dict:
+        '''Return the probe, hit, miss, store and overwrite counts'''
+        if self._probes:
+            hit_rate = self._hits / self._probes
+        else:
+            hit_rate = 0.0
+        return {'probes': self._probes, 'hits': self._hits,
+                'misses': self._probes - self._hits, 'hit_rate': hit_rate,
+                'stores': self._stores, 'overwrites': self._overwrites,
+                'buckets': self._mask + 1}